@@ -0,0 +1,191 @@
+'''Bet-or-roll advice for the two-player turn sequence of CamelUpGame.play_leg.
+
+   The rest of the leg is searched as an expectimax tree: the player to move chooses between rolling
+   and taking the top ticket of a Ticket Tent, the opponent answers the same way, and every roll is a
+   chance node over the dice left in the pyramid. Values are the mover's coins minus the opponent's
+   coins earned from here to the end of the leg, so the tree is searched negamax style with
+   alpha-beta pruning at the decision nodes.
+
+   A ticket is valued at its expected payout when it is taken (see CamelUpGame.get_ticket_EV). Every
+   die is rolled before the leg ends whatever the players choose, so that expectation does not change
+   with the moves made afterwards, and bets never need to be carried down the tree.
+'''
+import time
+
+import CamelUpState
+import CamelUpAnalysis
+
+EXACT, LOWER, UPPER = 0, 1, 2 #kinds of transposition table values
+SOLVED = 1_000 #transposition table depth of values searched to the end of the leg on every branch
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the time budget runs out'''
+
+
+class Recommendation:
+    '''The advisor's choice for the player to move'''
+    def __init__(self, move:str, color:str, value:float, depth:int, exact:bool, nodes:int, elapsed:float):
+        self.move = move #"r" to roll or "b" to bet
+        self.color = color #the color of the ticket to take when betting
+        self.value = value #expected coins gained over the opponent until the end of the leg
+        self.depth = depth #the number of turns searched
+        self.exact = exact #True when the search reached the end of the leg on every branch
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    def __repr__(self)->str:
+        action = f"bet on {self.color}" if self.move == "b" else "roll"
+        return (f"Recommendation({action}, value={self.value:+.2f}, depth={self.depth}"
+                f"{', exact' if self.exact else ''})")
+
+
+class CamelUpAdvisor:
+    '''Searches the rest of the leg for the best move of the player to move.
+       The transposition table is kept between calls, so advice later in the same leg reuses earlier searches.
+    '''
+    def __init__(self, board, time_budget:float=0.5, max_depth:int=None):
+        '''
+            Args
+               board (CamelUpBoard) - the board to advise on
+               time_budget (float) - seconds of search per recommendation
+               max_depth (int) - the most turns to search; None searches until the leg ends or time runs out
+        '''
+        self.board = board
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.table = {} #(state, mask, tents) -> (depth, value, kind, best action)
+        self.probabilities = {} #(state, mask) -> (1st place, 2nd place) probabilities by camel
+        self.nodes = 0
+        self._deadline = None
+
+    def leg_probabilities(self, state:tuple[int, ...], mask:int)->tuple[tuple[float, ...], tuple[float, ...]]:
+        '''Returns the 1st and 2nd place probabilities of each camel'''
+        key = (state, mask)
+        probabilities = self.probabilities.get(key)
+        if probabilities is None:
+            # a new leg analysis can take longer than many nodes of search on large variants
+            if self._deadline is not None and time.perf_counter() > self._deadline:
+                raise SearchTimeout()
+            # exact, or sampled when the leg is too large for the board's rules
+            counts = self.board.count_leg_outcomes(state=state, mask=mask)
+            n = len(state)
+            sequences = sum(counts[:n])
+            probabilities = (tuple(count/sequences for count in counts[:n]),
+                             tuple(count/sequences for count in counts[n:2*n]))
+            self.probabilities[key] = probabilities
+        return probabilities
+
+    def actions(self, state:tuple[int, ...], mask:int, tents:tuple[int, ...])->list[tuple[float, int]]:
+        '''Returns the (immediate gain, camel) of each available move, best first.
+           Camel -1 is a roll, which earns 1 coin; any other camel is a bet on that camel's top ticket.
+        '''
+        firsts, seconds = self.leg_probabilities(state, mask)
+        values = self.board.BETTING_TICKET_VALUES
+        moves = [(1.0, -1)] if mask else []
+        for camel, taken in enumerate(tents):
+            if taken < len(values):
+                first, second = firsts[camel], seconds[camel]
+                moves.append((values[taken]*first + second - (1-first-second), camel))
+        moves.sort(reverse=True)
+        return moves
+
+    def search(self, state:tuple[int, ...], mask:int, tents:tuple[int, ...], depth:int,
+               alpha:float, beta:float)->tuple[float, bool]:
+        '''Negamax search with alpha-beta pruning at decision nodes and averaging at chance nodes
+
+            Return
+               tuple[float, bool] - the value for the player to move (a bound when it falls outside
+                                    (alpha, beta)), and whether the leg ended on every searched branch
+        '''
+        if not mask or max(state) // CamelUpState.HEIGHT_SLOTS >= self.board.TRACK_POSITIONS-1:
+            return (0.0, True)
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+        moves = self.actions(state, mask, tents)
+        if depth == 0:
+            # horizon: assume the player to move takes the best immediate gain
+            return (moves[0][0], False)
+
+        key = (state, mask, tents)
+        entry = self.table.get(key)
+        if entry is not None:
+            entry_depth, value, kind, best = entry
+            if entry_depth >= depth:
+                if kind == EXACT or (kind == LOWER and value >= beta) or (kind == UPPER and value <= alpha):
+                    return (value, entry_depth == SOLVED)
+            # search the best move of the previous iteration first
+            moves.sort(key=lambda move: move[1] != best)
+
+        original_alpha = alpha
+        # complete: every searched branch reached the end of the leg, so the value (or bound) holds at any depth
+        best_value, best_move, complete = float("-inf"), None, True
+        last, dice_values = self.board.TRACK_POSITIONS-1, self.board.DICE_VALUES
+        for gain, camel in moves:
+            if camel == -1:
+                # chance node: every remaining die and value is equally likely
+                dice = CamelUpAnalysis.dice_in(mask)
+                total = 0.0
+                for rolled in dice:
+                    rest = mask & ~(1 << rolled)
+                    for value in dice_values:
+                        child, child_complete = self.search(CamelUpState.move(state, rolled, value, last), rest,
+                                                            tents, depth-1, float("-inf"), float("inf"))
+                        total += child
+                        complete = complete and child_complete
+                value = gain - total/(len(dice)*len(dice_values))
+            else:
+                taken = tents[:camel] + (tents[camel]+1,) + tents[camel+1:]
+                # value = gain - child, so the child's window is shifted by the gain
+                child, child_complete = self.search(state, mask, taken, depth-1, gain-beta, gain-alpha)
+                value = gain - child
+                complete = complete and child_complete
+            if value > best_value:
+                best_value, best_move = value, camel
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        kind = EXACT if original_alpha < best_value < beta else (LOWER if best_value >= beta else UPPER)
+        # values and bounds searched to the end of the leg hold at any depth
+        self.table[key] = (SOLVED if complete else depth, best_value, kind, best_move)
+        return (best_value, complete)
+
+    def recommend(self, tents:dict[str, list[int]]=None)->Recommendation:
+        '''Recommends a move for the player about to play on the board
+
+            Args
+               tents (dict[str, list[int]]) - the tickets left in each Ticket Tent; defaults to the board's
+
+            Return
+               Recommendation - the best move found by iterative deepening within the time budget
+        '''
+        board = self.board
+        tents = board.ticket_tents if tents is None else tents
+        taken = tuple(len(board.BETTING_TICKET_VALUES) - len(tents[color]) for color in board.camel_colors)
+        state, mask = board.state, board.pyramid_mask()
+        start = time.perf_counter()
+        self._deadline = start + self.time_budget
+        self.nodes = 0
+        if not mask or board.is_race_finished():
+            return Recommendation("r", "", 0.0, 0, True, 0, 0.0)
+
+        gain, camel = self.actions(state, mask, taken)[0]
+        result = (gain, camel, 0, False)
+        turns = len(CamelUpAnalysis.dice_in(mask)) + sum(len(values) for values in tents.values())
+        depth = 1
+        while depth <= (self.max_depth or turns):
+            try:
+                value, exact = self.search(state, mask, taken, depth, float("-inf"), float("inf"))
+            except SearchTimeout:
+                break
+            entry = self.table[(state, mask, taken)]
+            result = (value, entry[3], depth, exact)
+            if exact:
+                break
+            depth += 1
+
+        value, camel, depth, exact = result
+        move, color = ("r", "") if camel == -1 else ("b", board.camel_colors[camel])
+        return Recommendation(move, color, value, depth, exact, self.nodes, time.perf_counter() - start)
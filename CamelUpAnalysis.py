@@ -0,0 +1,758 @@
+'''Analysis engines that run on the compact track state (see CamelUpState).
+
+   Dice still in the pyramid are passed around as a bitmask over camel indices:
+   bit i is set when the die of camel i has not been rolled yet this leg.
+'''
+import itertools
+import math
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+import CamelUpState
+import CamelUpRandom
+
+
+class LRUCache:
+    '''A mapping with least-recently-used eviction and hit/miss counters.
+       It can be passed as the memo of the solvers in this module, so solved subtrees survive between
+       calls: after a die is rolled, the subtree of the new (state, remaining dice) is usually already cached.
+    '''
+    def __init__(self, maxsize:int=250_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        value = self._entries.get(key, default)
+        if value is default:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key)->bool:
+        return key in self._entries
+
+    def __len__(self)->int:
+        return len(self._entries)
+
+    def clear(self):
+        '''Removes every entry and resets the counters'''
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self)->dict[str, int]:
+        '''Returns the hit/miss counters along with the current and maximum size'''
+        return {"hits":self.hits, "misses":self.misses, "size":len(self._entries), "maxsize":self.maxsize}
+
+
+# the counts of a (state, mask) depend on the finish line and the dice, so each of those gets its own shared cache
+_shared_leg_caches = {}
+
+
+def shared_leg_cache(last:int, dice_values:tuple[int, ...], maxsize:int=250_000)->LRUCache:
+    '''Returns the process-wide cache of the leg analyses with finish line last and dice_values, so every analysis
+       in a process (batches, self-play games, server workers) reuses the subtrees solved by the others
+
+        Args
+           last (int) - the index of the last space on the track
+           dice_values (tuple[int, ...]) - the faces of each die
+           maxsize (int) - the least number of entries the cache keeps; a cache already shared is grown to it
+
+        Return
+           LRUCache - the same cache for every call with the same last and dice_values
+    '''
+    key = (last, tuple(dice_values))
+    cache = _shared_leg_caches.get(key)
+    if cache is None:
+        cache = _shared_leg_caches[key] = LRUCache(maxsize)
+    cache.maxsize = max(cache.maxsize, maxsize)
+    return cache
+
+
+def dice_in(mask:int)->list[int]:
+    '''Returns the camel indices whose dice are set in the pyramid bitmask'''
+    return [camel for camel in range(mask.bit_length()) if mask >> camel & 1]
+
+
+def nth_permutation(items:list, index:int)->tuple:
+    '''Returns permutation number index of items, in itertools.permutations order, without generating
+       the permutations before it
+    '''
+    items = list(items)
+    order = []
+    for remaining in range(len(items), 0, -1):
+        position, index = divmod(index, math.factorial(remaining-1))
+        order.append(items.pop(position))
+    return tuple(order)
+
+
+def field_width(n:int, dice_values:tuple[int, ...])->int:
+    '''Bits per count in a packed count vector: enough for every dice sequence of a full pyramid'''
+    return (math.factorial(n) * len(dice_values)**n).bit_length()
+
+
+def unpack_counts(packed:int, n:int, width:int)->tuple[int, ...]:
+    '''Splits a packed count vector (see count_leg_outcomes) into its 2*n*n counts'''
+    field = (1 << width) - 1
+    return tuple(packed >> (i*width) & field for i in range(2*n*n))
+
+
+def pack_counts(counts:tuple[int, ...], width:int)->int:
+    '''Packs counts into one int, width bits per count (see count_leg_outcomes)'''
+    packed = 0
+    for i, count in enumerate(counts):
+        packed |= count << (i*width)
+    return packed
+
+
+def _count_packed(state:tuple[int, ...], mask:int, last:int, dice_values:tuple[int, ...], memo, width:int)->int:
+    key = (state, mask)
+    packed = memo.get(key)
+    if packed is not None:
+        return packed
+    n = len(state)
+    if not mask:
+        order = CamelUpState.finishing_order(state)
+        packed = 1 << ((n*n + order[0]*n + order[1])*width)
+        for place, camel in enumerate(order):
+            packed |= 1 << ((place*n + camel)*width)
+    else:
+        packed = 0
+        for camel in dice_in(mask):
+            rest = mask & ~(1 << camel)
+            for value in dice_values:
+                packed += _count_packed(CamelUpState.move(state, camel, value, last), rest, last, dice_values,
+                                        memo, width)
+    memo[key] = packed
+    return packed
+
+
+def count_leg_outcomes(state:tuple[int, ...], mask:int, last:int, dice_values:tuple[int, ...]=(1, 2, 3),
+                       memo:dict=None)->tuple[int, ...]:
+    '''Counts finishing places over every dice sequence that could finish the leg.
+       The roll tree is walked depth first. Sequences that share a prefix share the work, and
+       subtrees that reach the same (state, remaining dice) are only solved once.
+
+       Each subtree's counts are packed into one int, field_width bits per count, so adding up the
+       counts of a subtree's children is a single integer addition whatever the number of counts.
+
+        Args
+           state (tuple[int, ...]) - the compact track state
+           mask (int) - bitmask of the dice still in the pyramid
+           last (int) - the index of the last space on the track
+           dice_values (tuple[int, ...]) - the faces of each die
+           memo (dict) - solved subtrees keyed on (state, mask); pass the same dict to reuse work across calls
+
+        Return
+           tuple[int, ...] - the rank counts, one row of n camels per place from 1st to last, followed by
+                             the (1st, 2nd) pair counts, one row of n 2nd place camels per 1st place camel.
+                             counts[:n] are the 1st place counts and counts[n:2*n] the 2nd place counts.
+                             Every dice sequence counts once, so the counts match enumerating
+                             get_all_dice_roll_sequences exactly.
+    '''
+    if memo is None:
+        memo = {}
+    n = len(state)
+    width = field_width(n, dice_values)
+    return unpack_counts(_count_packed(state, mask, last, dice_values, memo, width), n, width)
+
+
+def leg_search_size(dice:int, faces:int)->int:
+    '''Returns the number of roll prefixes of a leg with dice in the pyramid: an upper bound on the
+       subtrees count_leg_outcomes solves, before subtrees reached by different prefixes are merged
+    '''
+    size = prefixes = 1
+    for rolled in range(dice):
+        prefixes *= (dice - rolled) * faces
+        size += prefixes
+    return size
+
+
+ESTIMATORS = ("antithetic", "stratified", "conditional") #variance reduction techniques of the leg samplers
+
+
+def estimator_options(estimator:str)->tuple[bool, bool, bool]:
+    '''Parses the estimator of a leg sampler: "plain" Monte Carlo, or variance reduction techniques
+       joined with "+", e.g. "antithetic+conditional"
+
+        - antithetic: every draw is simulated twice, the second time rolling the dice in reverse order
+                      with every value mirrored (1 <-> 3). Mirroring the values alone correlates the pair
+                      positively; with the order reversed too the errors partly cancel out
+        - stratified: draw i empties the pyramid starting with die i % dice, so every die comes out
+                      first exactly as often instead of about as often
+        - conditional: the last die of the leg is not sampled; every value it can roll is counted
+                       (Rao-Blackwellization), so each simulated leg counts once per face
+
+       The gains are modest and depend on the board; the estimator[...] cases of CamelUpBenchmark measure
+       the error and the error per second of each.
+
+        Return
+           tuple[bool, bool, bool] - whether each technique of ESTIMATORS is used
+    '''
+    names = set() if estimator == "plain" else set(estimator.split("+"))
+    if not names <= set(ESTIMATORS):
+        raise ValueError(f"unknown estimator {estimator!r}: use 'plain' or techniques of {ESTIMATORS} joined with '+'")
+    return tuple(name in names for name in ESTIMATORS)
+
+
+def estimator_draws(trials:int, dice:int, estimator:str)->int:
+    '''Returns the number of random draws an estimator uses to simulate trials legs with dice in the pyramid:
+       antithetic draws give two legs each, and stratified draws are rounded up to a multiple of dice
+    '''
+    antithetic, stratified, conditional = estimator_options(estimator)
+    draws = -(-trials // 2) if antithetic else trials
+    if stratified and dice:
+        draws = -(-draws // dice) * dice
+    return draws
+
+
+def sample_leg_outcomes(state:tuple[int, ...], mask:int, trials:int, last:int, dice_values:tuple[int, ...],
+                        rng, estimator:str="plain")->tuple[int, ...]:
+    '''Counts 1st/2nd place finishes over randomly simulated legs, one trial at a time in pure Python
+
+        Args
+           state (tuple[int, ...]) - the compact track state
+           mask (int) - bitmask of the dice still in the pyramid
+           trials (int) - the number of random simulations to conduct
+           last (int) - the index of the last space on the track
+           dice_values (tuple[int, ...]) - the faces of each die
+           rng (CamelUpRandom.CounterRandom) - the generator to draw the legs from, or an int seed. Trial i
+                                               is decided by one draw (see CamelUpRandom.leg_draw), so
+                                               the counts match simulate_leg_outcomes for the same seed.
+           estimator (str) - "plain" or variance reduction techniques joined with "+" (see estimator_options)
+
+        Return
+           tuple[int, ...] - rank counts followed by (1st, 2nd) pair counts, laid out like count_leg_outcomes.
+                             The conditional estimator counts every leg once per face, so divide by the
+                             sum of the 1st place counts rather than by trials.
+    '''
+    n = len(state)
+    dice = dice_in(mask)
+    orders = list(itertools.permutations(dice))
+    antithetic, stratified, conditional = estimator_options(estimator)
+    draws = estimator_draws(trials, len(dice), estimator)
+    stratified, conditional = stratified and bool(dice), conditional and bool(dice)
+    block = len(orders) // max(len(dice), 1) #permutations come in blocks starting with the same die
+    rolled = len(dice) - conditional
+    faces = len(dice_values)
+    rng = CamelUpRandom.as_random(rng)
+    first = rng.take(draws)
+    counts = [0]*(2*n*n)
+    for i in range(first, first+draws):
+        order, values = CamelUpRandom.leg_draw(rng.key, i, len(dice), faces)
+        if stratified:
+            order = i % len(dice) * block + order % block
+        order = orders[order]
+        pairs = ((order, values), (order[::-1], [faces-1-value for value in values])) if antithetic else ((order, values),)
+        for order, values in pairs:
+            current = state
+            for camel, value in zip(order[:rolled], values):
+                current = CamelUpState.move(current, camel, dice_values[value], last)
+            ends = [CamelUpState.move(current, order[-1], value, last) for value in dice_values] \
+                if conditional else [current]
+            for end in ends:
+                finish = CamelUpState.finishing_order(end)
+                for place, camel in enumerate(finish):
+                    counts[place*n + camel] += 1
+                counts[n*n + finish[0]*n + finish[1]] += 1
+    return tuple(counts)
+
+
+class LegEstimate:
+    '''A running Monte Carlo estimate of each camel's 1st/2nd place probabilities'''
+    def __init__(self, camel_colors:list[str], counts:list[int], trials:int, elapsed:float, z:float,
+                 tolerance:float):
+        n = len(camel_colors)
+        self.trials = trials
+        self.elapsed = elapsed
+        self.probabilities = {}
+        self.standard_errors = {}
+        for i, color in enumerate(camel_colors):
+            first, second = counts[i]/trials, counts[n+i]/trials
+            self.probabilities[color] = (first, second)
+            self.standard_errors[color] = (math.sqrt(first*(1-first)/trials), math.sqrt(second*(1-second)/trials))
+        # half the width of the widest confidence interval
+        self.half_width = z*max(max(errors) for errors in self.standard_errors.values())
+        self.converged = self.half_width < tolerance
+
+    def __repr__(self)->str:
+        return f"LegEstimate(trials={self.trials}, half_width={self.half_width:.4f}, probabilities={self.probabilities})"
+
+
+class LegOutcome:
+    '''Probabilities of every finishing place and of every (1st, 2nd) pair of camels at the end of the leg.
+       Backed by a single array('d') laid out like the counts of count_leg_outcomes, so it is cheap to
+       pickle, send to other processes and serialize with to_bytes.
+    '''
+    def __init__(self, camel_colors:list[str], probabilities:array, total:int):
+        '''
+            Args
+               camel_colors (list[str]) - the camel colors, in the order of the probabilities
+               probabilities (array) - array('d') of rank probabilities followed by pair probabilities
+               total (int) - the number of dice sequences or trials the probabilities were counted over
+        '''
+        self.camel_colors = list(camel_colors)
+        self.probabilities = probabilities
+        self.total = total
+        self._index = {color:i for i, color in enumerate(self.camel_colors)}
+
+    @classmethod
+    def from_counts(cls, camel_colors:list[str], counts:tuple[int, ...]):
+        '''Builds the outcome of counts laid out like count_leg_outcomes'''
+        total = sum(counts[:len(camel_colors)])
+        return cls(camel_colors, array("d", (count/total for count in counts)), total)
+
+    def rank(self, color:str, place:int)->float:
+        '''Returns the probability that a camel finishes the leg in place (0 is 1st place)'''
+        return self.probabilities[place*len(self.camel_colors) + self._index[color]]
+
+    def ranks(self, color:str)->tuple[float, ...]:
+        '''Returns the probability of each place, from 1st to last, for a camel'''
+        n = len(self.camel_colors)
+        return tuple(self.probabilities[place*n + self._index[color]] for place in range(n))
+
+    def pair(self, first:str, second:str)->float:
+        '''Returns the probability that first comes 1st and second comes 2nd'''
+        n = len(self.camel_colors)
+        return self.probabilities[n*n + self._index[first]*n + self._index[second]]
+
+    def rank_matrix(self)->list[list[float]]:
+        '''Returns the camel x place probability matrix, in camel color order'''
+        return [list(self.ranks(color)) for color in self.camel_colors]
+
+    def as_dict(self)->dict[str, tuple[float, float]]:
+        '''Returns the 1st/2nd place probabilities in the format of run_enumerative_leg_analysis'''
+        return {color:(self.rank(color, 0), self.rank(color, 1)) for color in self.camel_colors}
+
+    def to_bytes(self)->bytes:
+        '''Serializes the outcome: camels (u8), colors, total (u64), then little-endian doubles'''
+        probabilities = self.probabilities
+        if sys.byteorder == "big":
+            probabilities = array("d", probabilities)
+            probabilities.byteswap()
+        colors = "".join(self.camel_colors).encode()
+        return struct.pack("<B", len(colors)) + colors + struct.pack("<Q", self.total) + probabilities.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data:bytes):
+        '''Reads an outcome written by to_bytes'''
+        n = data[0]
+        colors = list(data[1:1+n].decode())
+        total, = struct.unpack_from("<Q", data, 1+n)
+        probabilities = array("d", data[9+n:])
+        if sys.byteorder == "big":
+            probabilities.byteswap()
+        return cls(colors, probabilities, total)
+
+    def __repr__(self)->str:
+        return f"LegOutcome(total={self.total}, probabilities={self.as_dict()})"
+
+
+def iter_leg_estimates(camel_colors:list[str], sample, batch_size:int=1_000, tolerance:float=0.01,
+                       time_budget:float=None, max_trials:int=None, z:float=1.96):
+    '''Streams Monte Carlo estimates, one update per batch of trials, until every confidence interval is
+       narrower than tolerance, the time budget runs out or max_trials trials have been simulated.
+       At least one batch is always simulated.
+
+        Args
+           camel_colors (list[str]) - the camel colors, in the order of the counts
+           sample (function) - sample(trials) simulates a batch and returns its 1st/2nd place counts,
+                               e.g. a partial application of sample_leg_outcomes
+           batch_size (int) - the number of trials between updates
+           tolerance (float) - stop once z standard errors is below this for every probability
+           time_budget (float) - stop once this many seconds have passed
+           max_trials (int) - stop once this many trials have been simulated
+           z (float) - the number of standard errors in half a confidence interval: 1.96 for 95%
+
+        Yield
+           LegEstimate - the estimate over every trial so far; the last one has converged if the
+                         tolerance was reached
+    '''
+    start = time.perf_counter()
+    counts = [0]*(2*len(camel_colors))
+    trials = 0
+    while True:
+        size = batch_size if max_trials is None else min(batch_size, max_trials - trials)
+        counts = [a+b for a, b in zip(counts, sample(size))]
+        trials += size
+        estimate = LegEstimate(camel_colors, counts, trials, time.perf_counter() - start, z, tolerance)
+        yield estimate
+        if estimate.converged or (max_trials is not None and trials >= max_trials) \
+                or (time_budget is not None and estimate.elapsed >= time_budget):
+            return
+
+
+def apply_rolls(codes, camels, values, last:int, running=None):
+    '''Applies one roll to every column of a NumPy array of compact states, in place.
+       codes has one row per camel and one column per simulated board; column j rolls camels[j] for values[j].
+       The rolled camel and every camel above it move onto the top of the target space.
+
+        Args
+           codes (numpy.ndarray) - packed state codes, shape (camels, boards)
+           camels (numpy.ndarray) - the camel rolled on each board
+           values (numpy.ndarray) - the value rolled on each board
+           last (int) - the index of the last space on the track
+           running (numpy.ndarray) - optional booleans; boards where it is False are left unchanged
+    '''
+    import numpy as np
+
+    height_slots = CamelUpState.HEIGHT_SLOTS
+    code = codes[camels, np.arange(codes.shape[1])]
+    position = code // height_slots
+    target = np.minimum(position + values, last)
+    top = code - code % height_slots + height_slots
+    moves = target != position
+    if running is not None:
+        moves &= running
+    moving = (codes >= code) & (codes < top) & moves
+    base = target * height_slots
+    landing = ((codes >= base) & (codes < base + height_slots)).sum(axis=0, dtype=codes.dtype)
+    codes += moving * (base - code + landing)
+
+
+def simulate_leg_outcomes(state:tuple[int, ...], mask:int, trials:int, last:int,
+                          dice_values:tuple[int, ...]=(1, 2, 3), seed:int=None,
+                          batch_size:int=65_536, estimator:str="plain")->tuple[int, ...]:
+    '''Counts 1st/2nd place finishes over randomly simulated legs, simulating a whole batch of
+       trials at once with NumPy arrays instead of one trial at a time.
+
+       Each trial draws one random permutation of the dice in the pyramid and one die value per die,
+       from a single counter-based draw (see CamelUpRandom.leg_draws). Every roll is then applied to all
+       trials of the batch together: the rolled camel and every camel above it in its stack move onto
+       the top of the target space.
+
+        Args
+           state (tuple[int, ...]) - the compact track state
+           mask (int) - bitmask of the dice still in the pyramid
+           trials (int) - the number of random simulations to conduct
+           last (int) - the index of the last space on the track
+           dice_values (tuple[int, ...]) - the faces of each die
+           seed (int) - seed for the random generator, or a CamelUpRandom.CounterRandom to continue drawing
+                        from; the same seed reproduces the same counts, for any batch_size
+           batch_size (int) - the most draws held in memory at once
+           estimator (str) - "plain" or variance reduction techniques joined with "+" (see estimator_options)
+
+        Return
+           tuple[int, ...] - the same counts as sample_leg_outcomes
+    '''
+    rng = CamelUpRandom.as_random(seed)
+    draws = estimator_draws(trials, len(dice_in(mask)), estimator)
+    return _simulate_draws(state, mask, rng.key, rng.take(draws), draws, last, dice_values, estimator, batch_size)
+
+
+def simulate_leg_outcomes_bounded(state:tuple[int, ...], mask:int, trials:int, last:int,
+                                  dice_values:tuple[int, ...]=(1, 2, 3), seed:int=None, time_budget:float=None,
+                                  batch_size:int=65_536, estimator:str="plain")->tuple[int, ...]:
+    '''simulate_leg_outcomes in batches of batch_size trials, stopping early once time_budget seconds have
+       passed, so both the memory and the time spent are bounded however many camels and dice there are.
+       At least one batch is always simulated.
+
+        Return
+           tuple[int, ...] - counts laid out like simulate_leg_outcomes, over the trials simulated in time
+    '''
+    rng = CamelUpRandom.as_random(seed)
+    start = time.perf_counter()
+    counts = [0]*(2*len(state)**2)
+    for done in range(0, trials, batch_size):
+        batch = simulate_leg_outcomes(state, mask, min(batch_size, trials-done), last, dice_values, rng,
+                                      batch_size, estimator)
+        counts = [a+b for a, b in zip(counts, batch)]
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            break
+    return tuple(counts)
+
+
+def _simulate_draws(state:tuple[int, ...], mask:int, key:int, first:int, draws:int, last:int,
+                    dice_values:tuple[int, ...], estimator:str, batch_size:int=65_536)->tuple[int, ...]:
+    '''Counts the legs of draws first to first+draws of the generator with key (see simulate_leg_outcomes)'''
+    import numpy as np
+
+    n = len(state)
+    dice = dice_in(mask)
+    # drawing a row of this table is much cheaper than shuffling every trial
+    orders = list(itertools.permutations(dice))
+    orders = np.array(orders, dtype=np.intp).reshape(len(orders), len(dice))
+    antithetic, stratified, conditional = estimator_options(estimator)
+    stratified, conditional = stratified and bool(dice), conditional and bool(dice)
+    block = len(orders) // max(len(dice), 1) #permutations come in blocks starting with the same die
+    rolled = len(dice) - conditional
+    faces = np.array(dice_values, dtype=np.int64)
+    height_slots = CamelUpState.HEIGHT_SLOTS
+    # one row per camel and one column per trial keeps every comparison contiguous
+    dtype = np.int16 if (last+1)*height_slots < 2**15 else np.int64
+    counts = np.zeros(2*n*n, dtype=np.int64)
+    # what a camel adds to the (1st, 2nd) pair index of a trial, by the place it finishes in
+    pair_codes = np.zeros((n, n), dtype=np.intp)
+    pair_codes[:, 0] = np.arange(n)*n
+    pair_codes[:, 1] = np.arange(n)
+    # every draw becomes several columns with the antithetic and conditional estimators
+    step = max(1, batch_size // ((1+antithetic) * (len(faces) if conditional else 1)))
+    for start in range(first, first+draws, step):
+        ids = np.arange(start, min(start+step, first+draws), dtype=np.uint64)
+        order, values = CamelUpRandom.leg_draws(key, ids, len(dice), len(faces))
+        if stratified:
+            order = (ids % np.uint64(len(dice))).astype(np.intp)*block + order % block
+        order = orders[order].T
+        if antithetic:
+            order = np.concatenate([order, order[::-1]], axis=1)
+            values = np.concatenate([values, len(faces)-1-values], axis=1)
+        values = faces[values].astype(dtype)
+        codes = np.repeat(np.array(state, dtype=dtype)[:, None], order.shape[1], axis=1)
+        for roll in range(rolled):
+            apply_rolls(codes, order[roll], values[roll], last)
+        if conditional:
+            # one copy of every board per value of the last die
+            columns = codes.shape[1]
+            codes = np.tile(codes, len(faces))
+            apply_rolls(codes, np.tile(order[-1], len(faces)), np.repeat(faces.astype(dtype), columns), last)
+        # codes are distinct, so a camel's place is the number of camels with a higher code:
+        # comparing every pair of rows is several times faster than sorting every column
+        place = np.zeros(codes.shape, dtype=np.int8)
+        for i in range(n):
+            for j in range(i+1, n):
+                behind = codes[i] < codes[j]
+                place[i] += behind
+                place[j] += ~behind
+        pair = np.zeros(codes.shape[1], dtype=np.intp)
+        for camel in range(n):
+            counts[camel:n*n:n] += np.bincount(place[camel], minlength=n)
+            pair += pair_codes[camel][place[camel]]
+        counts[n*n:] += np.bincount(pair, minlength=n*n)
+    return tuple(int(count) for count in counts)
+
+
+def _count_branch(branch:tuple)->tuple[int, ...]:
+    '''Process pool task: solves the subtree below one first roll'''
+    state, mask, last, dice_values = branch
+    return count_leg_outcomes(state, mask, last, dice_values)
+
+
+def _simulate_shard(shard:tuple)->tuple[int, ...]:
+    '''Process pool task: simulates one shard of draws, starting at its first draw'''
+    state, mask, draws, last, dice_values, rng, estimator = shard
+    return _simulate_draws(state, mask, rng.key, rng.counter, draws, last, dice_values, estimator)
+
+
+def _shards(trials:int, seed:int, shard_size:int, trial_draws:int=1)->list[tuple]:
+    '''Splits trials into (size, random generator) shards of trials using trial_draws draw numbers each.
+       Each shard's generator is positioned at the draw number of its first trial, so the shards simulate
+       exactly the trials of a serial run.
+    '''
+    rng = CamelUpRandom.as_random(seed)
+    first = rng.take(trials*trial_draws)
+    return [(min(shard_size, trials-start), rng.jumped(first+start*trial_draws))
+            for start in range(0, trials, shard_size)]
+
+
+def _run_tasks(task, arguments:list, workers:int, executor)->list:
+    '''Runs task over arguments in a process pool and returns the results in argument order'''
+    if executor is not None:
+        return list(executor.map(task, arguments))
+    if workers is None or workers <= 1:
+        return [task(argument) for argument in arguments]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(task, arguments))
+
+
+def _add_counts(results:list)->tuple[int, ...]:
+    return tuple(sum(column) for column in zip(*results))
+
+
+def count_leg_outcomes_parallel(state:tuple[int, ...], mask:int, last:int, dice_values:tuple[int, ...]=(1, 2, 3),
+                                workers:int=None, executor=None, memo:dict=None)->tuple[int, ...]:
+    '''Parallel version of count_leg_outcomes.
+       Each (color, value) branch of the first roll is solved by a separate task and the integer counts
+       are added up, so the result is identical to count_leg_outcomes for any number of workers.
+
+        Args
+           state, mask, last, dice_values - see count_leg_outcomes
+           workers (int) - the number of worker processes to start; None or 1 runs in this process
+           executor (concurrent.futures.Executor) - an already running pool to use instead of starting one
+           memo (dict) - when given, the result is stored in it for count_leg_outcomes to find
+
+        Return
+           tuple[int, ...] - the same counts as count_leg_outcomes
+    '''
+    if memo is not None and (state, mask) in memo:
+        return count_leg_outcomes(state, mask, last, dice_values, memo)
+    if not mask:
+        return count_leg_outcomes(state, mask, last, dice_values)
+    branches = [(CamelUpState.move(state, camel, value, last), mask & ~(1 << camel), last, dice_values)
+                for camel in dice_in(mask) for value in dice_values]
+    counts = _add_counts(_run_tasks(_count_branch, branches, workers, executor))
+    if memo is not None:
+        memo[(state, mask)] = pack_counts(counts, field_width(len(state), dice_values))
+    return counts
+
+
+def simulate_leg_outcomes_parallel(state:tuple[int, ...], mask:int, trials:int, last:int,
+                                   dice_values:tuple[int, ...]=(1, 2, 3), seed:int=None, workers:int=None,
+                                   executor=None, shard_size:int=65_536, estimator:str="plain")->tuple[int, ...]:
+    '''Parallel version of simulate_leg_outcomes.
+       The draws are split into shards of shard_size draws. Trial i uses draw i of the generator
+       whichever shard simulates it, so for a given seed the counts are identical to simulate_leg_outcomes,
+       whether the shards run on one process or many.
+
+        Args
+           state, mask, trials, last, dice_values - see simulate_leg_outcomes
+           seed (int) - seed for the random generator, or a CamelUpRandom.CounterRandom to continue drawing from
+           workers (int) - the number of worker processes to start; None or 1 runs in this process
+           executor (concurrent.futures.Executor) - an already running pool to use instead of starting one
+           shard_size (int) - the number of draws simulated by one task
+           estimator (str) - "plain" or variance reduction techniques joined with "+" (see estimator_options)
+
+        Return
+           tuple[int, ...] - the same counts as simulate_leg_outcomes
+    '''
+    draws = estimator_draws(trials, len(dice_in(mask)), estimator)
+    shards = [(state, mask, size, last, dice_values, stream, estimator)
+              for size, stream in _shards(draws, seed, shard_size)]
+    return _add_counts(_run_tasks(_simulate_shard, shards, workers, executor))
+
+
+def count_race_outcomes(state:tuple[int, ...], mask:int, rolls:int, last:int, dice_values:tuple[int, ...]=(1, 2, 3),
+                        memo:dict=None)->tuple[float, ...]:
+    '''Exact probability that each camel wins or loses the race within the next rolls rolls.
+       Rolls continue across leg boundaries: once the pyramid is empty it is refilled with every die,
+       like CamelUpGame.reset. The race ends as soon as a camel reaches the last space of the track.
+
+       Branches stop early when the race ends, and when no camel can reach the finish line within the
+       rolls that are left. The probability of the race still running after rolls rolls is whatever is
+       missing from the total of the win probabilities.
+
+        Args
+           state (tuple[int, ...]) - the compact track state
+           mask (int) - bitmask of the dice still in the pyramid
+           rolls (int) - the number of rolls to look ahead
+           last (int) - the index of the last space on the track (the finish line)
+           dice_values (tuple[int, ...]) - the faces of each die
+           memo (dict) - solved subtrees keyed on (state, mask, rolls)
+
+        Return
+           tuple[float, ...] - the probability of winning for each camel followed by the probability
+                               of losing (coming in last) for each camel
+    '''
+    if memo is None:
+        memo = {}
+    n = len(state)
+    finish = last * CamelUpState.HEIGHT_SLOTS
+    leader = max(state)
+    if leader >= finish:
+        totals = [0.0]*(2*n)
+        totals[state.index(leader)] = 1.0
+        totals[n+state.index(min(state))] = 1.0
+        return tuple(totals)
+    if (leader // CamelUpState.HEIGHT_SLOTS) + rolls*max(dice_values) < last:
+        return (0.0,)*(2*n)
+    key = (state, mask, rolls)
+    probabilities = memo.get(key)
+    if probabilities is not None:
+        return probabilities
+    if not mask:
+        mask = (1 << n) - 1
+    dice = dice_in(mask)
+    weight = 1/(len(dice)*len(dice_values))
+    totals = [0.0]*(2*n)
+    for camel in dice:
+        rest = mask & ~(1 << camel)
+        for value in dice_values:
+            child = count_race_outcomes(CamelUpState.move(state, camel, value, last), rest, rolls-1, last,
+                                        dice_values, memo)
+            totals = [a + weight*b for a, b in zip(totals, child)]
+    probabilities = tuple(totals)
+    memo[key] = probabilities
+    return probabilities
+
+
+RACE_DRAWS = 2**16 #draw numbers reserved for each simulated race, one per leg
+
+
+def simulate_race_outcomes(state:tuple[int, ...], mask:int, trials:int, last:int,
+                           dice_values:tuple[int, ...]=(1, 2, 3), seed:int=None,
+                           batch_size:int=65_536)->tuple[int, ...]:
+    '''Counts race winners and losers over randomly simulated races, a whole batch of trials at a time.
+       Legs are simulated like in simulate_leg_outcomes. The pyramid is refilled with every die at the end
+       of each leg, and a trial stops as soon as a camel reaches the last space of the track. Finished trials
+       are dropped from the batch at the end of each leg, so later legs only simulate races still running.
+
+        Args
+           state (tuple[int, ...]) - the compact track state
+           mask (int) - bitmask of the dice still in the pyramid
+           trials (int) - the number of random races to simulate
+           last (int) - the index of the last space on the track (the finish line)
+           dice_values (tuple[int, ...]) - the faces of each die
+           seed (int) - seed for the random generator, or a CamelUpRandom.CounterRandom to continue drawing
+                        from; leg l of trial i is decided by draw first + i*RACE_DRAWS + l, where first is
+                        the generator's counter, and every trial's RACE_DRAWS draw numbers are reserved
+           batch_size (int) - the most trials held in memory at once
+
+        Return
+           tuple[int, ...] - win counts for each camel followed by loss (last place) counts for each camel
+    '''
+    import numpy as np
+
+    rng = CamelUpRandom.as_random(seed)
+    first = rng.take(trials*RACE_DRAWS)
+    n = len(state)
+    faces = np.array(dice_values, dtype=np.int64)
+    height_slots = CamelUpState.HEIGHT_SLOTS
+    finish = last * height_slots
+    dtype = np.int16 if (last+1)*height_slots < 2**15 else np.int64
+    full_orders = np.array(list(itertools.permutations(range(n))), dtype=np.intp)
+    first_orders = list(itertools.permutations(dice_in(mask)))
+    first_orders = np.array(first_orders, dtype=np.intp).reshape(len(first_orders), len(dice_in(mask)))
+    wins = np.zeros(n, dtype=np.int64)
+    losses = np.zeros(n, dtype=np.int64)
+    done = 0
+    while done < trials:
+        size = min(batch_size, trials - done)
+        done += size
+        codes = np.repeat(np.array(state, dtype=dtype)[:, None], size, axis=1)
+        draws = np.uint64(first) + np.arange(done-size, done, dtype=np.uint64)*np.uint64(RACE_DRAWS)
+        orders = first_orders if mask else full_orders
+        while codes.shape[1]:
+            order, values = CamelUpRandom.leg_draws(rng.key, draws, orders.shape[1], len(faces))
+            order = orders[order].T
+            values = faces[values].astype(dtype)
+            running = codes.max(axis=0) < finish
+            for roll in range(order.shape[0]):
+                apply_rolls(codes, order[roll], values[roll], last, running)
+                running &= codes.max(axis=0) < finish
+            finished = ~running
+            wins += np.bincount(codes[:, finished].argmax(axis=0), minlength=n)
+            losses += np.bincount(codes[:, finished].argmin(axis=0), minlength=n)
+            codes = codes[:, running]
+            draws = draws[running] + np.uint64(1)
+            orders = full_orders
+    return tuple(int(count) for count in wins) + tuple(int(count) for count in losses)
+
+
+def _simulate_race_shard(shard:tuple)->tuple[int, ...]:
+    '''Process pool task: simulates one shard of races, starting at its first trial's draw'''
+    state, mask, trials, last, dice_values, seed = shard
+    return simulate_race_outcomes(state, mask, trials, last, dice_values, seed)
+
+
+def simulate_race_outcomes_parallel(state:tuple[int, ...], mask:int, trials:int, last:int,
+                                    dice_values:tuple[int, ...]=(1, 2, 3), seed:int=None, workers:int=None,
+                                    executor=None, shard_size:int=65_536)->tuple[int, ...]:
+    '''Parallel version of simulate_race_outcomes, sharded like simulate_leg_outcomes_parallel.
+       For a given seed the counts are identical to simulate_race_outcomes.
+    '''
+    shards = [(state, mask, size, last, dice_values, stream)
+              for size, stream in _shards(trials, seed, shard_size, RACE_DRAWS)]
+    return _add_counts(_run_tasks(_simulate_race_shard, shards, workers, executor))
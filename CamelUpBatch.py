@@ -0,0 +1,131 @@
+'''Stateless batch analysis of many board positions in one call.
+
+   A position is encoded as one row of ints: the compact track state (see CamelUpState) followed by the
+   pyramid bitmask (see CamelUpAnalysis). Rows can be built with encode_position and stored in a NumPy
+   array of shape (positions, camels+1), so large logs of recorded positions are scored without building
+   a CamelUpBoard per position.
+'''
+import CamelUpState
+import CamelUpAnalysis
+import CamelUpTables
+import CamelUpRandom
+
+def encode_position(track:list[list[str]], pyramid:set[str], camel_colors:list[str])->tuple[int, ...]:
+    '''Encodes a board position as one row for analyze_positions
+
+        Args
+           track (list[list[str]]) - a 2D list model of the Camel Up race track
+           pyramid (set[str]) - the colors of the dice still in the pyramid
+           camel_colors (list[str]) - the camel colors, in the order of the columns
+
+        Return
+           tuple[int, ...] - the compact state of each camel followed by the pyramid bitmask
+    '''
+    mask = 0
+    for i, color in enumerate(camel_colors):
+        if color in pyramid:
+            mask |= 1 << i
+    return CamelUpState.encode_track(track, camel_colors) + (mask,)
+
+
+def _solve_positions(task:tuple)->list[tuple[int, ...]]:
+    '''Exact 1st/2nd place counts for a chunk of distinct positions'''
+    rows, last, dice_values = task
+    results = []
+    cache = CamelUpAnalysis.shared_leg_cache(last, dice_values, 1_000_000)
+    for row in rows:
+        state, mask = row[:-1], row[-1]
+        counts = CamelUpTables.lookup_leg_outcomes(state, mask, last, dice_values)
+        if counts is None:
+            counts = CamelUpAnalysis.count_leg_outcomes(state, mask, last, dice_values, cache)
+        results.append(counts)
+    return results
+
+
+def _exact(rows:list[tuple[int, ...]], last:int, dice_values:tuple[int, ...], workers:int, chunk_size:int):
+    import numpy as np
+
+    n = len(rows[0]) - 1
+    unique = list(dict.fromkeys(rows))
+    tasks = [(unique[start:start+chunk_size], last, dice_values) for start in range(0, len(unique), chunk_size)]
+    solved = {}
+    for task, results in zip(tasks, CamelUpAnalysis._run_tasks(_solve_positions, tasks, workers, None)):
+        solved.update(zip(task[0], results))
+    counts = np.array([solved[row][:2*n] for row in rows], dtype=np.float64).reshape(len(rows), 2, n)
+    return counts / counts[:, :1, :].sum(axis=2, keepdims=True)
+
+
+def _monte_carlo(rows:list[tuple[int, ...]], last:int, dice_values:tuple[int, ...], trials:int, seed:int,
+                 batch_size:int):
+    import itertools
+    import numpy as np
+
+    n = len(rows[0]) - 1
+    rng = CamelUpRandom.as_random(seed)
+    first_draw = rng.take(trials) #every position reuses the same draws, so it matches a simulate_leg_outcomes run
+    faces = np.array(dice_values, dtype=np.int64)
+    dtype = np.int16 if (last+1)*CamelUpState.HEIGHT_SLOTS < 2**15 else np.int64
+    table = np.array(rows, dtype=np.int64)
+    counts = np.zeros((len(rows), 2, n), dtype=np.int64)
+    # positions with the same dice left in the pyramid are simulated together, trials columns per position
+    for mask in np.unique(table[:, -1]):
+        group = np.flatnonzero(table[:, -1] == mask)
+        states = table[group, :-1].astype(dtype)
+        dice = CamelUpAnalysis.dice_in(int(mask))
+        orders = list(itertools.permutations(dice))
+        orders = np.array(orders, dtype=np.intp).reshape(len(orders), len(dice))
+        firsts = np.zeros(len(group)*n, dtype=np.int64)
+        seconds = np.zeros(len(group)*n, dtype=np.int64)
+        columns = len(group)*trials
+        for start in range(0, columns, batch_size):
+            owner = np.arange(start, min(start+batch_size, columns)) // trials
+            codes = states[owner].T.copy()
+            draws = (first_draw + np.arange(start, start+len(owner)) - owner*trials).astype(np.uint64)
+            order, values = CamelUpRandom.leg_draws(rng.key, draws, len(dice), len(faces))
+            order = orders[order].T
+            values = faces[values].astype(dtype)
+            for roll in range(len(dice)):
+                CamelUpAnalysis.apply_rolls(codes, order[roll], values[roll], last)
+            first = codes.argmax(axis=0)
+            codes[first, np.arange(len(owner))] = -1
+            second = codes.argmax(axis=0)
+            firsts += np.bincount(owner*n + first, minlength=len(group)*n)
+            seconds += np.bincount(owner*n + second, minlength=len(group)*n)
+        counts[group, 0] = firsts.reshape(len(group), n)
+        counts[group, 1] = seconds.reshape(len(group), n)
+    return counts / trials
+
+
+def analyze_positions(positions, last:int=15, dice_values:tuple[int, ...]=(1, 2, 3), method:str="exact",
+                      trials:int=10_000, seed:int=None, workers:int=None, chunk_size:int=256,
+                      batch_size:int=262_144):
+    '''Analyzes the probability that each camel comes in 1st or 2nd place this leg, for many positions
+
+        Args
+           positions - encoded positions (see encode_position): a sequence of rows or a NumPy array
+                       of shape (positions, camels+1)
+           last (int) - the index of the last space on the track
+           dice_values (tuple[int, ...]) - the faces of each die
+           method (str) - "exact" to count every dice sequence, or "monte-carlo" to simulate trials legs
+                          per position, vectorized across every position with the same dice in the pyramid
+           trials (int) - the number of random legs per position for "monte-carlo"
+           seed (int) - seed for the "monte-carlo" random generator; each position gets the counts
+                        CamelUpAnalysis.simulate_leg_outcomes gives it with the same seed
+           workers (int) - solve "exact" chunks of distinct positions on this many worker processes
+           chunk_size (int) - the number of distinct positions per "exact" task
+           batch_size (int) - the most simulated boards held in memory at once for "monte-carlo"
+
+        Return
+           numpy.ndarray - probabilities of shape (positions, 2, camels): [:, 0] is 1st place, [:, 1] is 2nd place
+    '''
+    import numpy as np
+
+    rows = [tuple(int(value) for value in row) for row in positions]
+    if not rows:
+        return np.zeros((0, 2, 0))
+    dice_values = tuple(dice_values)
+    if method == "exact":
+        return _exact(rows, last, dice_values, workers, chunk_size)
+    if method == "monte-carlo":
+        return _monte_carlo(rows, last, dice_values, trials, seed, batch_size)
+    raise ValueError(f"unknown method {method!r}: expected 'exact' or 'monte-carlo'")
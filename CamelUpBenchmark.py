@@ -0,0 +1,325 @@
+'''Benchmarks for the CamelUpBoard hot paths.
+
+   Every case runs on boards built from fixed seeds, so runs are comparable across commits.
+   Results are written as JSON and can be compared against a stored baseline:
+
+        python CamelUpBenchmark.py --output bench.json
+        python CamelUpBenchmark.py --baseline benchmark_baseline.json      # exits with 1 on a regression
+        python CamelUpBenchmark.py --save-baseline benchmark_baseline.json
+
+   The cold_start cases time fresh interpreters from spawn to exit, as a CLI command or a spawned worker
+   process pays them. They are also checked against COLD_START_BUDGETS, and main exits with 1 when one is
+   over its budget, with or without a baseline.
+
+   The leg outcome table is git-ignored and only present once built (see CamelUpTables). Cases it answers
+   are named with a table suffix, so they are never compared against a baseline recorded without it, and
+   the cold start cases of LEG_TABLE_CASES are skipped when it is missing.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+from statistics import median
+
+from colorama import Back, Style
+
+from CamelUpBoard import CamelUpBoard
+import CamelUpTables
+
+CAMEL_STYLES = {
+    "r": Back.RED+Style.BRIGHT,
+    "b": Back.BLUE+Style.BRIGHT,
+    "g": Back.GREEN+Style.BRIGHT,
+    "y": Back.YELLOW+Style.BRIGHT,
+    "p": Back.MAGENTA
+}
+BOARD_SEED = 2024
+PYRAMID_SIZES = [1, 2, 3, 4, 5]
+EXPERIMENTAL_TRIALS = [1_000, 5_000, 20_000]
+VECTORIZED_TRIALS = [100_000, 1_000_000]
+ESTIMATORS = ["plain", "antithetic", "stratified", "conditional", "antithetic+stratified+conditional"]
+ESTIMATOR_TRIALS = 20_000
+ESTIMATOR_RUNS = 50
+# the code run by each cold start case: importing the game, solving a small leg as a spawned analysis worker
+# does, and the first analysis of a new headless game (which loads the leg outcome table on demand)
+COLD_START_CASES = {
+    "python": "pass",
+    "import CamelUpGame": "import CamelUpGame",
+    "import CamelUpSelfPlay": "import CamelUpSelfPlay",
+    "worker first result": "import CamelUpAnalysis; CamelUpAnalysis._count_branch(((0, 1, 16, 17, 32), 3, 15, (1, 2, 3)))",
+    "game first result": "from CamelUpGame import CamelUpGame; "
+                         "CamelUpGame('p1', 'p2', 1, display=False).board.run_enumerative_leg_analysis()",
+}
+# the cold start cases that measure loading the leg outcome table, only run when it has been built
+LEG_TABLE_CASES = {"game first result"}
+# seconds each cold start case may take on top of a bare interpreter (the python case)
+COLD_START_BUDGETS = {
+    "import CamelUpGame": 0.025,
+    "import CamelUpSelfPlay": 0.03,
+    "worker first result": 0.015,
+    "game first result": 0.03,
+}
+
+
+def make_board(pyramid_size:int, seed:int=BOARD_SEED)->CamelUpBoard:
+    '''Builds a board from a fixed seed and rolls dice until pyramid_size dice are left in the pyramid'''
+    board = CamelUpBoard(CAMEL_STYLES, seed)
+    while len(board.pyramid) > pyramid_size:
+        board._move(board.shake_pyramid())
+    return board
+
+
+def time_case(function, repeats:int, setup=None)->dict[str, float]:
+    '''Times function() repeats times, calling setup() untimed before each run
+
+        Return
+           dict[str, float] - the median and minimum time in seconds, and the number of repeats
+    '''
+    times = []
+    for i in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"median_s":median(times), "min_s":min(times), "repeats":repeats}
+
+
+def peak_kib(function)->float:
+    '''Returns the peak memory allocated while function() runs, in KiB'''
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]/1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_cold_start(code:str, repeats:int=9)->dict[str, float]:
+    '''Times fresh interpreters running code, from spawn to exit. Bytecode is written by an untimed first
+       run, so the cases measure imports and the first result rather than compiling the modules.
+    '''
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, "-c", code]
+    run = lambda: subprocess.run(command, check=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    run()
+    return time_case(run, repeats)
+
+
+def over_budget(results:dict)->list[str]:
+    '''Returns a description of each cold start case slower than its COLD_START_BUDGETS entry'''
+    python = results.get("cold_start[python]")
+    failures = []
+    for name, budget in COLD_START_BUDGETS.items():
+        measured = results.get(f"cold_start[{name}]")
+        if python and measured and measured["min_s"] - python["min_s"] > budget:
+            failures.append(f"cold_start[{name}]: {measured['min_s']-python['min_s']:.4f}s "
+                            f"over the interpreter startup > {budget:.4f}s budget")
+    return failures
+
+
+def bench_move_camel(calls:int=10_000)->dict[str, float]:
+    board = make_board(5)
+    dice = [(color, value) for color in board.camel_colors for value in board.DICE_VALUES]
+    start_track = board.track
+
+    def run():
+        board.track = start_track
+        for i in range(calls):
+            board.move_camel(dice[i % len(dice)])
+    return time_case(run, 5)
+
+
+def bench_get_rankings(calls:int=10_000)->dict[str, float]:
+    board = make_board(5)
+
+    def run():
+        for i in range(calls):
+            board.get_rankings()
+    return time_case(run, 5)
+
+
+def bench_render(frames:int=2_000, color:bool=True)->dict[str, float]:
+    '''Renders frames board frames, one roll apart, and adds the frames per second of the fastest repeat'''
+    from CamelUpPlayer import CamelUpPlayer
+    from CamelUpRenderer import BoardRenderer
+
+    board = make_board(5)
+    players = [CamelUpPlayer("p1"), CamelUpPlayer("p2")]
+    dice = [(color, value) for color in board.camel_colors for value in board.DICE_VALUES]
+    states = []
+    for i in range(100):
+        board._move(dice[(7*i) % len(dice)])
+        if board.is_race_finished():
+            board.track = make_board(5).track
+        states.append(board.state)
+
+    def run():
+        renderer = BoardRenderer(CAMEL_STYLES, board.TRACK_POSITIONS, color)
+        for i in range(frames):
+            board.state = states[i % len(states)]
+            players[i % 2].money = i
+            renderer.render(board, players)
+    result = time_case(run, 5)
+    result["frames_per_s"] = frames/result["min_s"]
+    return result
+
+
+def bench_estimator(board:CamelUpBoard, estimator:str, trials:int=ESTIMATOR_TRIALS,
+                    runs:int=ESTIMATOR_RUNS)->dict[str, float]:
+    '''Times runs vectorized experimental analyses with different seeds, and measures their error against
+       the exact run_enumerative_leg_analysis answer
+
+        Return
+           dict[str, float] - the timings of time_case, the root mean squared error of the 1st/2nd place
+                              probabilities, and the efficiency 1/(error**2 * seconds): higher reaches the
+                              same accuracy in less time
+    '''
+    exact = board.run_enumerative_leg_analysis()
+    seeds = iter(range(runs))
+    errors = []
+
+    def run():
+        estimate = board.run_experimental_leg_analysis(trials, vectorized=True, seed=next(seeds),
+                                                       estimator=estimator)
+        errors.extend((estimate[color][place] - exact[color][place])**2 for color in exact for place in (0, 1))
+    result = time_case(run, runs, board.analysis_cache.clear)
+    result["rmse"] = (sum(errors)/len(errors))**0.5
+    result["efficiency"] = 1/(result["rmse"]**2 * result["median_s"])
+    return result
+
+
+def uses_leg_table(board:CamelUpBoard)->bool:
+    '''Whether the board's leg analysis is answered from the precomputed leg outcome table'''
+    rules = board.rules
+    return CamelUpTables.lookup_leg_outcomes(board.state, board.pyramid_mask(), rules.last,
+                                             rules.dice_values) is not None
+
+
+def run_benchmarks(quick:bool=False)->dict[str, dict[str, float]]:
+    '''Runs every benchmark case
+
+        Args
+           quick (bool) - skip the slowest cases (largest trial counts)
+
+        Return
+           dict[str, dict[str, float]] - timing results keyed on case name
+    '''
+    results = {}
+    table = uses_leg_table(make_board(len(CAMEL_STYLES)))
+    if not table:
+        print("no leg outcome table, skipping", ", ".join(sorted(LEG_TABLE_CASES)),
+              "(build it with: python CamelUpTables.py)", file=sys.stderr)
+    for name, code in COLD_START_CASES.items():
+        if name in LEG_TABLE_CASES and not table:
+            continue
+        results[f"cold_start[{name}]"] = bench_cold_start(code)
+    results["move_camel[x10000]"] = bench_move_camel()
+    results["get_rankings[x10000]"] = bench_get_rankings()
+    results["render[x2000]"] = bench_render()
+    results["render[no-color,x2000]"] = bench_render(color=False)
+    for size in PYRAMID_SIZES:
+        board = make_board(size)
+        results[f"get_all_dice_roll_sequences[pyramid={size}]"] = time_case(board.get_all_dice_roll_sequences, 5)
+        results[f"get_all_dice_roll_sequences[pyramid={size}]"]["peak_kib"] = peak_kib(board.get_all_dice_roll_sequences)
+        stream = lambda: deque(board.iter_dice_roll_sequences(), maxlen=0)
+        results[f"iter_dice_roll_sequences[pyramid={size}]"] = time_case(stream, 5)
+        results[f"iter_dice_roll_sequences[pyramid={size}]"]["peak_kib"] = peak_kib(stream)
+        # clear the analysis cache so every repeat solves the leg from scratch
+        suffix = ",table" if uses_leg_table(board) else ""
+        results[f"run_enumerative_leg_analysis[pyramid={size}{suffix}]"] = time_case(
+            board.run_enumerative_leg_analysis, 5, board.analysis_cache.clear)
+    board = make_board(5)
+    for trials in EXPERIMENTAL_TRIALS:
+        results[f"run_experimental_leg_analysis[trials={trials}]"] = time_case(
+            lambda: board.run_experimental_leg_analysis(trials), 5, board.analysis_cache.clear)
+    for trials in VECTORIZED_TRIALS[:1] if quick else VECTORIZED_TRIALS:
+        results[f"run_experimental_leg_analysis[vectorized,trials={trials}]"] = time_case(
+            lambda: board.run_experimental_leg_analysis(trials, vectorized=True, seed=BOARD_SEED), 3,
+            board.analysis_cache.clear)
+    board = make_board(4)
+    for estimator in ESTIMATORS[:1]+ESTIMATORS[-1:] if quick else ESTIMATORS:
+        results[f"estimator[{estimator},trials={ESTIMATOR_TRIALS}]"] = bench_estimator(board, estimator)
+    return results
+
+
+HOST_KEYS = ("python", "machine") #timings are only comparable against a baseline saved with the same values
+
+
+def host_differences(report:dict, baseline:dict)->list[str]:
+    '''Returns a description of each HOST_KEYS value that differs between a report and a baseline'''
+    return [f"{key} {baseline.get(key)} -> {report[key]}" for key in HOST_KEYS if baseline.get(key) != report[key]]
+
+
+def compare(results:dict, baseline:dict, tolerance:float, min_delta:float=0.0005)->list[str]:
+    '''Compares results against a baseline
+
+        Args
+           results (dict) - timing results from run_benchmarks
+           baseline (dict) - a previously saved benchmark report
+           tolerance (float) - the allowed slowdown, as a fraction of the baseline: 0.25 allows 25%
+           min_delta (float) - slowdowns smaller than this many seconds are treated as timer noise
+
+        Return
+           list[str] - a description of each case slower than the baseline allows
+    '''
+    regressions = []
+    for name, expected in baseline["results"].items():
+        if name not in results:
+            continue
+        # the fastest repeat is the least affected by other load on the machine
+        measured = results[name]["min_s"]
+        if measured > expected["min_s"] * (1 + tolerance) and measured - expected["min_s"] > min_delta:
+            regressions.append(f"{name}: {measured:.6f}s > {expected['min_s']:.6f}s (+{tolerance:.0%} allowed)")
+    return regressions
+
+
+def main(argv:list[str]=None)->int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="compare against this JSON report and fail on regressions")
+    parser.add_argument("--save-baseline", help="write the JSON report to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--quick", action="store_true", help="skip the slowest cases")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python":platform.python_version(),
+        "machine":platform.machine(),
+        "board_seed":BOARD_SEED,
+        "results":run_benchmarks(args.quick),
+    }
+    text = json.dumps(report, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                file.write(text+"\n")
+    if not args.output and not args.save_baseline:
+        print(text)
+
+    failures = over_budget(report["results"])
+    for failure in failures:
+        print("OVER BUDGET", failure, file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        differences = host_differences(report, baseline)
+        if differences:
+            print(f"WARNING not comparing against {args.baseline}, saved on another host ({', '.join(differences)});",
+                  "save a baseline on this one with --save-baseline", file=sys.stderr)
+        else:
+            regressions = compare(report["results"], baseline, args.tolerance)
+            for regression in regressions:
+                print("REGRESSION", regression, file=sys.stderr)
+            failures += regressions
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
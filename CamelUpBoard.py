@@ -1,26 +1,52 @@
 import itertools
-import random
 import math
-from itertools import permutations, product
-import copy
-from colorama import Fore, Back, Style, init
+from itertools import product
 
 #/opt/homebrew/bin/python3.10 CamelUpGame.py
 
-from CamelUpPlayer import CamelUpPlayer
+import CamelUpState
+import CamelUpAnalysis
+import CamelUpTables
+import CamelUpProfiler
+import CamelUpRandom
+from CamelUpRules import CamelUpRules
 
-class CamelUpBoard:
-    def __init__(self, camel_styles: list[str]):
-        self.TRACK_POSITIONS = 16
-        self.DICE_VALUES = [1,2,3]
-        self.BETTING_TICKET_VALUES = [5, 3, 2, 2]
+TYPE_CHECKING = False #type checkers treat this as True; importing typing would double the import time
+if TYPE_CHECKING:
+    from CamelUpPlayer import CamelUpPlayer
 
+class CamelUpBoard:
+    def __init__(self, camel_styles:dict[str, str]=None, seed:int=None, rules:CamelUpRules=None):
+        '''
+            Args
+               camel_styles (dict[str, str]) - the colorama style of each camel color; None uses
+                                               CamelUpRenderer.CAMEL_PALETTE when the board is first printed
+               seed (int) - seed for the starting positions and dice
+               rules (CamelUpRules) - the variant to play; by default the standard game with the camels
+                                      of camel_styles
+        '''
+        if rules is None:
+            rules = CamelUpRules(camel_colors=list(camel_styles)) if camel_styles else CamelUpRules()
+        self.rules = rules
+        if camel_styles is not None and not set(self.rules.camel_colors) <= set(camel_styles):
+            raise ValueError("every camel of the rules needs a style")
+        self.TRACK_POSITIONS = self.rules.track_positions
+        self.DICE_VALUES = list(self.rules.dice_values)
+        self.BETTING_TICKET_VALUES = list(self.rules.ticket_values)
+
+        self.rng = CamelUpRandom.CounterRandom(seed) #same seed, same starting positions and rolls
+        # analyses draw from their own stream, so asking for advice does not change the game's rolls
+        self.analysis_rng = self.rng.spawn(1)
         self.camel_styles = camel_styles
-        self.camel_colors= camel_styles.keys()
+        self.camel_colors= list(self.rules.camel_colors)
+        self.camel_index = {color:i for i, color in enumerate(self.camel_colors)}
         self.track = self.starting_camel_positions()
         self.pyramid = set(self.camel_colors)
         self.ticket_tents = {color:self.BETTING_TICKET_VALUES.copy() for color in self.camel_colors}
         self.dice_tents = [] #preserves order
+        # solved leg subtrees and recent analysis results, keyed on the compact (track, pyramid) state
+        self.analysis_cache = CamelUpAnalysis.LRUCache()
+        self.renderer = None #built on the first print (see CamelUpRenderer)
 
     def starting_camel_positions(self)->list[list[str]]:
         '''Places camels on the board at the beginning of the game
@@ -32,12 +58,31 @@ class CamelUpBoard:
         track = [[] for i in range(self.TRACK_POSITIONS)]
         for color in self.camel_colors:
             # track[0].append(color)
-            track[random.randint(0,2)].append(color)
+            track[self.rng.randint(0, self.rules.start_spaces-1)].append(color)
         
         return track
+
+    @property
+    def track(self)->list[list[str]]:
+        '''A 2D list view of the compact track state (see CamelUpState).
+           The view is rebuilt on every access, so in-place edits such as self.track[i].append(camel) are
+           silently dropped; assign a new 2D list to self.track instead.
+        '''
+        return CamelUpState.decode_state(self.state, self.camel_colors, self.TRACK_POSITIONS)
+
+    @track.setter
+    def track(self, track:list[list[str]]):
+        self.state = CamelUpState.encode_track(track, self.camel_colors)
+
+    def pyramid_mask(self)->int:
+        '''Returns the dice still in the pyramid as a bitmask over camel indices'''
+        mask = 0
+        for color in self.pyramid:
+            mask |= 1 << self.camel_index[color]
+        return mask
     
     
-    def print(self, players: list[CamelUpPlayer]):
+    def print(self, players: list["CamelUpPlayer"]):
         '''Prints the current state of the Camel Up board, including:
             - Race track with current camel positions
             - Betting Tents displaying available betting tickets
@@ -47,48 +92,16 @@ class CamelUpBoard:
                 - coins
                 - betting tickets for the current leg of the race
         '''
-        board_string = "\n"
-         #Ticket Tents
-        ticket_string = "Ticket Tents: "
-        for ticket_color in self.ticket_tents:
-            if len(self.ticket_tents[ticket_color]) > 0:
-                next_ticket_value = str(self.ticket_tents[ticket_color][0])
-            else:
-                next_ticket_value = 'X'
-            ticket_string+=self.camel_styles[ticket_color]+next_ticket_value+Style.RESET_ALL+" "
-        board_string += ticket_string +"\t\t"
+        if self.renderer is None:
+            # rendering, and colorama with it, is only loaded by boards that are printed
+            import CamelUpRenderer
 
-        #Dice Tents
-        dice_string = "Dice Tents: "
-        for die in self.dice_tents:
-            dice_string+=self.camel_styles[die[0]]+str(die[1])+Style.RESET_ALL+" "
-
-        for i in range (5-len(self.dice_tents)):
-            dice_string+=Back.WHITE+" "+Style.RESET_ALL+" "
-        
-        #Camels and Race Track
-        board_string += dice_string +"\n"
-        for row in range(4, -1, -1):
-            row_str = [" "]*16
-            for i in range(len(self.track)):
-                for camel_place, camel in enumerate(self.track[i]):
-                    if camel_place == row:
-                        row_str[i]=self.camel_styles[camel]+ camel +  Style.RESET_ALL 
-            board_string += "🌴 "+str("   ".join(row_str))+" |🏁\n"
-        board_string += "   "+"".join([str(i)+"   " for i in range(1, 10)])
-        board_string += "".join([str(i)+"  " for i in range(10, 17)])+"\n"
-
-        #Player Info
-        player_string=""
-        for player in players:
-            player_string+=f"{player.name} has {player.money} coins."
-            if len(player.bets)>0:
-                bets_string = " ".join([self.camel_styles[bet[0]]+str(bet[1])+Style.RESET_ALL for bet in player.bets])
-                player_string += f" Bets: {bets_string}"  
-            player_string+="\t\t" 
-        
-        board_string+=player_string
-        print(board_string+"\n")
+            if self.camel_styles is None:
+                styles = CamelUpRenderer.camel_styles(self.camel_colors)
+            else:
+                styles = {color:self.camel_styles[color] for color in self.camel_colors}
+            self.renderer = CamelUpRenderer.BoardRenderer(styles, self.TRACK_POSITIONS)
+        print(self.renderer.render(self, players))
 
     def reset_tents(self):
         '''Rests dice tents and ticket tents at the end of a leg
@@ -123,19 +136,22 @@ class CamelUpBoard:
              die (tuple[str, int]) - A tuple representation of the die: ('g', 2)
 
            Return
-             list[list[str]] - a 2D list model of the Camel Up race track
+             list[list[str]] - a 2D list model of the Camel Up race track; callers that do not need it
+                               use _move, which skips building the view
         '''
         if verbose: print("Current track state:", self.track)
         ### BEGIN SOLUTION
-        if not die[0]:
-            return self.track
-        index = [i for i, pair in enumerate(self.track) if die[0] in pair][0]
-        self.track[min(15, index+die[1])].extend(self.track[index][self.track[index].index(die[0]):])
-        self.track[index] = self.track[index][0:self.track[index].index(die[0])]
+        self._move(die)
         
         ### END SOLUTION
         if verbose: print("Updated track state:", self.track)
         return self.track
+
+    def _move(self, die:tuple[str, int]):
+        '''move_camel on the compact state only: the game, the server and log replays ignore the track view'''
+        if die[0]:
+            self.state = CamelUpState.move(self.state, self.camel_index[die[0]], die[1], self.TRACK_POSITIONS-1)
+
     def shake_pyramid(self)->tuple[str, int]:
         '''Manages all the steps (from the board persepctive) involved with shaking the pyramid, 
            which includes:
@@ -151,8 +167,8 @@ class CamelUpBoard:
             return rolled_die
         ### BEGIN SOLUTION
 
-        roll = random.randint(1, 3)
-        die = random.sample(self.pyramid, 1)[0]
+        roll = self.rng.choice(self.DICE_VALUES)
+        die = self.rng.choice(sorted(self.pyramid))
         self.pyramid.remove(die)
         self.dice_tents.append((die, roll))
         return (die, roll)
@@ -173,6 +189,14 @@ class CamelUpBoard:
 
         ### END SOLUTION
 
+    def is_race_finished(self)->bool:
+        '''Determines whether a camel has reached the finish line (the last space of the track)
+
+           Return
+             bool - True if the race is over, False otherwise
+        '''
+        return max(self.state) // CamelUpState.HEIGHT_SLOTS >= self.TRACK_POSITIONS-1
+
     def get_rankings(self):
         '''Determines first and second place camels on the track
            
@@ -182,24 +206,53 @@ class CamelUpBoard:
         rankings = ("", "")
         ### BEGIN SOLUTION
         
-        # print(self.track)
-        camels = [pos for pos in self.track if pos]
-        first = camels[-1][-1]
-        global second
-        second = 0
-        if len(camels[-1]) == 1:
-            second = camels[-2][-1]
-        else:   
-            second = camels[-1][-2]
-        rankings = (first, second)  
+        first, second = CamelUpState.rankings(self.state)
+        rankings = (self.camel_colors[first], self.camel_colors[second])
 
         ### END SOLUTION
         return rankings
 
+    def count_dice_roll_sequences(self)->int:
+        '''Returns the number of dice sequences that could finish this leg, without generating them:
+           every order of the dice in the pyramid times every value of each die
+        '''
+        return math.factorial(len(self.pyramid)) * len(self.DICE_VALUES)**len(self.pyramid)
+
+    def iter_dice_roll_sequences(self, chunk:int=0, chunks:int=1):
+        '''Streams the dice sequences that could finish this leg, one at a time in constant memory.
+           Sequence i is decoded from its index: the order of the dice is permutation i // faces**dice
+           of the sorted pyramid, and the values are the rest of i in base faces. So the sequences can be
+           split into chunks that parallel consumers generate independently, without skipping through
+           the sequences before their chunk.
+
+           Args
+              chunk (int): Generate this chunk only, from 0 to chunks-1
+              chunks (int): The number of equal chunks the sequences are split into
+
+           Yield
+              tuple[tuple[str, int]] - one ordered dice sequence, e.g. (('g', 2), ('r', 1), ...)
+        '''
+        if not 0 <= chunk < chunks:
+            raise ValueError(f"chunk must be between 0 and {chunks-1}")
+        dice = sorted(self.pyramid)
+        per_order = len(self.DICE_VALUES)**len(dice)
+        total = self.count_dice_roll_sequences()
+        start, stop = total*chunk // chunks, total*(chunk+1) // chunks
+        for index in range(start // per_order, -(-stop // per_order)):
+            order = CamelUpAnalysis.nth_permutation(dice, index)
+            values = product(self.DICE_VALUES, repeat=len(dice))
+            first, last = max(start - index*per_order, 0), min(stop - index*per_order, per_order)
+            if first or last < per_order:
+                # only the first and last order of a chunk are partial
+                values = itertools.islice(values, first, last)
+            for rolled in values:
+                yield tuple(zip(order, rolled))
+
     def get_all_dice_roll_sequences(self)-> set:
         '''
-            Constructs a set of all possible roll sequences for the dice currently in the pyramid
-            Note: Use itertools product function
+            Constructs a set of all possible roll sequences for the dice currently in the pyramid.
+            Kept for compatibility: iter_dice_roll_sequences streams the same sequences without holding
+            them in memory, and count_dice_roll_sequences counts them without generating them.
         
             Return
                set[tuple[tuple[str, int]]] - A set of tuples representing all the ordered dice seqences 
@@ -207,38 +260,79 @@ class CamelUpBoard:
         ''' 
         roll_space = set()
         ### BEGIN SOLUTION
-        color_combos = itertools.permutations(self.pyramid)
-        dice_combos = product([1,2,3], repeat=len(self.pyramid))
-        all_combos = product(color_combos, dice_combos)
-
-        new = []
-        for combo in all_combos:
-            sub = []
-            for i in range(len(combo[0])): 
-                sub.append((combo[0][i], combo[1][i]))
-            new.append(tuple(sub))
-        # print(new)
-
-
-        roll_space = set(tuple(new))
-                
+        roll_space = set(self.iter_dice_roll_sequences())
         
         ### END SOLUTION
         return roll_space
     
-    def run_enumerative_leg_analysis(self)->dict[str, tuple[float, float]]:
+    def count_leg_outcomes(self, workers:int=None, state:tuple[int, ...]=None, mask:int=None)->tuple[int, ...]:
+        '''Counts the finishing places of every camel over every dice sequence that could finish this leg
+           (see CamelUpAnalysis.count_leg_outcomes).
+
+           Legs whose exact search is too large for the rules (see CamelUpRules.is_exact_tractable), e.g.
+           full pyramids of 7 or 8 camels, are sampled instead, within the rules' trials, memory and time
+           budgets. Divide by the sum of the 1st place counts to get probabilities either way.
+
+           Args
+              workers (int): Solve the branches of the first roll on this many worker processes
+              state (tuple[int, ...]): Analyze this compact track state instead of the board's
+              mask (int): Analyze this pyramid bitmask instead of the board's
+
+           Returns:
+              tuple[int, ...] - rank counts followed by (1st, 2nd) pair counts, in camel color order
+        '''
+        state = self.state if state is None else state
+        mask = self.pyramid_mask() if mask is None else mask
+        rules = self.rules
+        last, dice_values = rules.last, rules.dice_values
+        n = len(self.camel_colors)
+        # at the start of a leg, far from the finish line, the answer is precomputed (see CamelUpTables)
+        counts = CamelUpTables.lookup_leg_outcomes(state, mask, last, dice_values)
+        if counts is None and not rules.is_exact_tractable(len(CamelUpAnalysis.dice_in(mask))):
+            key = ("sampled", state, mask)
+            counts = self.analysis_cache.get(key)
+            if counts is None:
+                counts = CamelUpAnalysis.simulate_leg_outcomes_bounded(state, mask, rules.sample_trials, last,
+                                                                       dice_values, self.analysis_rng,
+                                                                       rules.sample_time_budget,
+                                                                       rules.sample_batch_size,
+                                                                       rules.sample_estimator)
+                self.analysis_cache[key] = counts
+                if CamelUpProfiler.PROFILER.enabled:
+                    CamelUpProfiler.PROFILER.count("experimental.sequences_evaluated", sum(counts[:n]))
+            return counts
+        misses = self.analysis_cache.misses
+        if counts is None:
+            if workers:
+                CamelUpAnalysis.count_leg_outcomes_parallel(state, mask, last, dice_values, workers,
+                                                            memo=self.analysis_cache)
+            # repeated queries, and queries after a roll from an analyzed state, are served from the cache
+            counts = CamelUpAnalysis.count_leg_outcomes(state, mask, last, dice_values, self.analysis_cache)
+        if CamelUpProfiler.PROFILER.enabled:
+            # every state solved by this query was a cache miss
+            CamelUpProfiler.PROFILER.count("enumerative.states_visited", self.analysis_cache.misses - misses)
+            CamelUpProfiler.PROFILER.count("enumerative.sequences_evaluated", sum(counts[:n]))
+        return counts
+
+    def run_enumerative_leg_analysis(self, workers:int=None)->dict[str, tuple[float, float]]:
         '''Conducts an enumerative analysis of the probability that each camel will win either 1st or 
            2nd place in this leg of the race. The enumerative analysis counts 1st/2nd place finishes 
            via calculating the entire state space tree
 
            General Steps:
-                1) Precalculate all possible dice sequences for the dice currently in the pyramid
-                2) Move through each sequence of possible dice rolls to count the number of 1st/2nd places 
-                   finishes for each camel
+                1) Walk the tree of possible dice rolls depth first, solving each (track state, remaining dice)
+                   subtree only once (see CamelUpAnalysis.count_leg_outcomes). With a full pyramid and no 
+                   camel able to reach the finish line, look the counts up in the precomputed table instead
+                   (see CamelUpTables).
+                2) Count the number of 1st/2nd places finishes for each camel over every dice sequence
                 3) Calculates the probability that each camel will come in 1st or 2nd based on the total 
                    number of 1st/2nd finishes out of the total number of dice sequences
 
-                TODO: Add notes about using deepcopy to preserve state
+                Note: the simulation runs on the compact state (see CamelUpState), which is immutable,
+                      so self.track and self.pyramid are never modified and no deepcopy is needed
+
+           Args
+              workers (int): Solve the branches of the first roll on this many worker processes
            
            Returns: 
               dict[str, tuple[float, float]] - A dictionary representing the probabilities that a camel will 
@@ -251,24 +345,17 @@ class CamelUpBoard:
         '''
         win_percents={color:(0, 0) for color in self.camel_colors}
         ### BEGIN SOLUTION
-        copy_track = copy.deepcopy(self.track)
-        allRolls = self.get_all_dice_roll_sequences()
-        for roll in allRolls:
-            self.track = copy.deepcopy(copy_track)
-            for move in roll:
-                self.move_camel(move)
-            win_percents[self.get_rankings()[0]] = (win_percents[self.get_rankings()[0]][0]+1, win_percents[self.get_rankings()[0]][1])
-            win_percents[self.get_rankings()[1]] = (win_percents[self.get_rankings()[1]][0], win_percents[self.get_rankings()[1]][1]+1)
-            
-        for color in win_percents:
-            win_percents[color] = (win_percents[color][0]/len(allRolls), win_percents[color][1]/len(allRolls))
-        
-        self.track = copy_track
+        n = len(self.camel_colors)
+        counts = self.count_leg_outcomes(workers)
+        sequences = sum(counts[:n])
+        for i, color in enumerate(self.camel_colors):
+            win_percents[color] = (counts[i]/sequences, counts[n+i]/sequences)
 
         ### END SOLUTION
         return win_percents
 
-    def run_experimental_leg_analysis(self, trials:int)->dict[str, tuple[float, float]]:
+    def run_experimental_leg_analysis(self, trials:int, vectorized:bool=False, seed:int=None,
+                                      workers:int=None, estimator:str="plain")->dict[str, tuple[float, float]]:
         '''Conducts an experimental analysis (ie. a random simulation) of the probability that each camel
             will win either 1st or 2nd place in this leg of the race. The experimenta analysis counts 
             1st/2nd place finishes bycounting outcomes from randomly shaking the pyramid over a given 
@@ -281,10 +368,26 @@ class CamelUpBoard:
                 3) Calculate the probability that each camel will come in 1st or 2nd based on the total 
                    number of 1st/2nd finishes out of the total number of trials
 
-                TODO: Add notes about using deepcopy to preserve state
+                Note: the simulation runs on the compact state (see CamelUpState), which is immutable,
+                      so self.track and self.pyramid are never modified and no deepcopy is needed
 
            Args
               trials (int): The number of random simulations to conduct
+              vectorized (bool): Simulate the trials in batches of NumPy arrays (see 
+                                 CamelUpAnalysis.simulate_leg_outcomes) instead of one at a time
+              seed (int): Seed for the random generator, for reproducible results; by default the trials
+                          are drawn from the board's analysis stream. For a given seed the result is the same
+                          whether the trials are vectorized or not and whatever the number of workers.
+              workers (int): Split the trials into shards simulated on this many worker processes
+                             (implies vectorized)
+              estimator (str): "plain" Monte Carlo, or variance reduction techniques joined with "+":
+                               "antithetic", "stratified" and "conditional" (see
+                               CamelUpAnalysis.estimator_options). Each lowers the error at the same
+                               number of trials on most boards, by up to about 20%, but conditional
+                               costs more time per trial than it saves.
+
+           Results are kept in self.analysis_cache, so asking again about the same track, pyramid and 
+           arguments returns the previous estimate instantly instead of running new trials.
 
            Returns: 
               dict[str, tuple[float, float]] - A dictionary representing the probabilities that a camel will 
@@ -297,26 +400,31 @@ class CamelUpBoard:
         '''
         win_percents={color:(0, 0) for color in self.camel_colors}
         ### BEGIN SOLUTION
-        copy_track = copy.deepcopy(self.track)
-        copy_pyramid = copy.deepcopy(self.pyramid)
-        for i in range(trials):
-            self.track = copy.deepcopy(copy_track)
-            pyramid = copy.deepcopy(copy_pyramid)
-            while len(pyramid) > 0:
-                 # roll = self.shake_pyramid()
-                 die = random.sample(pyramid, 1)[0]
-                 roll = random.randint(1,3)
-                 pyramid.remove(die)
-                 self.move_camel((die, roll))
-            win_percents[self.get_rankings()[0]] = (win_percents[self.get_rankings()[0]][0]+1, win_percents[self.get_rankings()[0]][1])
-            win_percents[self.get_rankings()[1]] = (win_percents[self.get_rankings()[1]][0], win_percents[self.get_rankings()[1]][1]+1)
-            
-            
-        for color in win_percents:
-            win_percents[color] = (win_percents[color][0]/trials, win_percents[color][1]/trials)
-        
-        self.track = copy_track
-        self.pyramid = copy_pyramid
+        key = ("experimental", self.state, self.pyramid_mask(), trials, vectorized, seed, estimator)
+        cached = self.analysis_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        n = len(self.camel_colors)
+        rng = self.analysis_rng if seed is None else seed
+        if workers:
+            counts = CamelUpAnalysis.simulate_leg_outcomes_parallel(self.state, self.pyramid_mask(), trials,
+                                                                    self.TRACK_POSITIONS-1, tuple(self.DICE_VALUES),
+                                                                    rng, workers, estimator=estimator)
+        elif vectorized:
+            counts = CamelUpAnalysis.simulate_leg_outcomes(self.state, self.pyramid_mask(), trials,
+                                                           self.TRACK_POSITIONS-1, tuple(self.DICE_VALUES), rng,
+                                                           estimator=estimator)
+        else:
+            counts = CamelUpAnalysis.sample_leg_outcomes(self.state, self.pyramid_mask(), trials,
+                                                         self.TRACK_POSITIONS-1, tuple(self.DICE_VALUES), rng,
+                                                         estimator)
+        if CamelUpProfiler.PROFILER.enabled:
+            CamelUpProfiler.PROFILER.count("experimental.sequences_evaluated", trials)
+        total = sum(counts[:n]) #more than trials when legs are counted once per value of the last die
+        for i, color in enumerate(self.camel_colors):
+            win_percents[color] = (counts[i]/total, counts[n+i]/total)
+        self.analysis_cache[key] = dict(win_percents)
 
         ### END SOLUTION
         return win_percents
@@ -345,8 +453,112 @@ class CamelUpBoard:
         # ### END SOLUTION
         # self.track = oldTrack
         # return win_percents
+
+    def run_leg_outcome_analysis(self, trials:int=None, seed:int=None, workers:int=None,
+                                 estimator:str="plain")->CamelUpAnalysis.LegOutcome:
+        '''Analyzes the probability of every finishing place for every camel in this leg, and of every
+           (1st, 2nd) pair of camels, in the same pass that run_enumerative_leg_analysis and
+           run_experimental_leg_analysis use for 1st and 2nd place
+
+           Args
+              trials (int): Simulate this many random legs (vectorized) instead of counting every dice sequence
+              seed (int): Seed for the random generator, for reproducible results
+              workers (int): Solve, or simulate, on this many worker processes
+              estimator (str): How to simulate trials (see run_experimental_leg_analysis)
+
+           Returns:
+              CamelUpAnalysis.LegOutcome - e.g. .rank('r', 4) is the probability that 'r' comes last,
+                                           .pair('r', 'b') that 'r' comes 1st and 'b' comes 2nd
+        '''
+        if trials is None:
+            counts = self.count_leg_outcomes(workers)
+        else:
+            counts = CamelUpAnalysis.simulate_leg_outcomes_parallel(self.state, self.pyramid_mask(), trials,
+                                                                    self.TRACK_POSITIONS-1, tuple(self.DICE_VALUES),
+                                                                    self.analysis_rng if seed is None else seed,
+                                                                    workers, estimator=estimator)
+        return CamelUpAnalysis.LegOutcome.from_counts(self.camel_colors, counts)
+
+    def iter_experimental_leg_analysis(self, batch_size:int=1_000, tolerance:float=0.01, time_budget:float=None,
+                                       max_trials:int=None, vectorized:bool=False, seed:int=None):
+        '''Streams an experimental analysis: yields updated 1st/2nd place estimates, with standard errors,
+           after every batch of trials. Stops early once every 95% confidence interval is narrower than
+           tolerance on each side, or once time_budget seconds have passed (see CamelUpAnalysis.iter_leg_estimates).
+
+           Args
+              batch_size (int): The number of random simulations between updates
+              tolerance (float): Stop once every confidence interval is within +/- tolerance
+              time_budget (float): Stop once this many seconds have passed
+              max_trials (int): Stop once this many simulations have been conducted
+              vectorized (bool): Simulate each batch with NumPy arrays
+              seed (int): Seed for the random generator, for reproducible results; by default the trials
+                          are drawn from the board's analysis stream
+
+           Yield
+              CamelUpAnalysis.LegEstimate - the estimate so far: .probabilities has the same format as 
+                                            run_experimental_leg_analysis, .standard_errors the matching errors
+        '''
+        state, mask, last, dice_values = self.state, self.pyramid_mask(), self.TRACK_POSITIONS-1, tuple(self.DICE_VALUES)
+        # every batch continues from the draws of the previous one
+        rng = self.analysis_rng if seed is None else CamelUpRandom.CounterRandom(seed)
+        if vectorized:
+            sample = lambda trials: CamelUpAnalysis.simulate_leg_outcomes(state, mask, trials, last, dice_values, rng)
+        else:
+            sample = lambda trials: CamelUpAnalysis.sample_leg_outcomes(state, mask, trials, last, dice_values, rng)
+        return CamelUpAnalysis.iter_leg_estimates(self.camel_colors, sample, batch_size, tolerance, time_budget, max_trials)
+
+    def run_race_analysis(self, trials:int=100_000, max_rolls:int=None, seed:int=None,
+                          workers:int=None)->dict[str, tuple[float, float]]:
+        '''Analyzes the probability that each camel will win or lose (come in last) the whole race, 
+           not just the current leg. Rolls continue across leg boundaries with the pyramid refilled 
+           at the end of each leg, until a camel reaches the finish line.
+
+           Two engines are available:
+                - experimental (default): simulates trials races in vectorized batches 
+                  (see CamelUpAnalysis.simulate_race_outcomes)
+                - enumerative (max_rolls given): exactly walks the roll tree max_rolls rolls deep, 
+                  stopping early on branches where the race has ended or can no longer end in time 
+                  (see CamelUpAnalysis.count_race_outcomes)
+
+           Args
+              trials (int): The number of random races to simulate
+              max_rolls (int): Use the enumerative engine, looking this many rolls ahead. The returned 
+                               probabilities are of winning/losing within max_rolls rolls, so they add 
+                               up to less than 1 when the race may still be running after that.
+              seed (int): Seed for the random generator, for reproducible results
+              workers (int): Split the trials into seeded shards simulated on this many worker processes
+
+           Returns: 
+              dict[str, tuple[float, float]] - A dictionary representing the probabilities that a camel will 
+                                               win or lose the race
+                {
+                    'r':(0.5, 0.1),
+                    'b':(0.1, 0.3),
+                    ...
+                }
+        '''
+        n = len(self.camel_colors)
+        last = self.TRACK_POSITIONS-1
+        if max_rolls is not None:
+            probabilities = CamelUpAnalysis.count_race_outcomes(self.state, self.pyramid_mask(), max_rolls, last,
+                                                                tuple(self.DICE_VALUES))
+            return {color:(probabilities[i], probabilities[n+i]) for i, color in enumerate(self.camel_colors)}
+
+        rng = self.analysis_rng if seed is None else seed
+        if workers:
+            counts = CamelUpAnalysis.simulate_race_outcomes_parallel(self.state, self.pyramid_mask(), trials, last,
+                                                                     tuple(self.DICE_VALUES), rng, workers)
+        else:
+            counts = CamelUpAnalysis.simulate_race_outcomes(self.state, self.pyramid_mask(), trials, last,
+                                                            tuple(self.DICE_VALUES), rng)
+        if CamelUpProfiler.PROFILER.enabled:
+            CamelUpProfiler.PROFILER.count("race.sequences_evaluated", trials)
+        return {color:(counts[i]/trials, counts[n+i]/trials) for i, color in enumerate(self.camel_colors)}
    
 if __name__ == "__main__":
+    from colorama import Back, Style
+    from CamelUpPlayer import CamelUpPlayer
+
     camel_styles= {
             "r": Back.RED+Style.BRIGHT,
             "b": Back.BLUE+Style.BRIGHT,
@@ -369,9 +581,7 @@ if __name__ == "__main__":
     # board.move_camel(rolled_die)
     board.print([p1, p2])
     #Probabilites
-    all_possible_dice_sequences= board.get_all_dice_roll_sequences()
-    # print(all_possible_dice_sequences)
-    print(f"{len(all_possible_dice_sequences)} possible dice sequences for {len(board.pyramid)} dice in the pyramid:") 
+    print(f"{board.count_dice_roll_sequences()} possible dice sequences for {len(board.pyramid)} dice in the pyramid:") 
     print("Enumerative Probabilities:", board.run_enumerative_leg_analysis())
     print("Experimental Probabilities:", board.run_experimental_leg_analysis(5000))
     print(board.get_rankings())
@@ -1,31 +1,59 @@
-from colorama import Fore, Back, Style, init
-
 from CamelUpBoard import CamelUpBoard
 from CamelUpPlayer import CamelUpPlayer
+from CamelUpAdvisor import CamelUpAdvisor
+from CamelUpRules import CamelUpRules
 
 class CamelUpGame:
-    def __init__(self, p1_name:str, p2_name:str):
-        self.CAMEL_STYLES= {
-            "r": Back.RED+Style.BRIGHT,
-            "b": Back.BLUE+Style.BRIGHT,
-            "g": Back.GREEN+Style.BRIGHT,
-            "y": Back.YELLOW+Style.BRIGHT,
-            "p": Back.MAGENTA
-        }
-        self.board = CamelUpBoard(self.CAMEL_STYLES)
+    ADVICE_TIME_BUDGET = 0.1 #seconds of Monte Carlo simulation per AI Advice
+    ADVISOR_TIME_BUDGET = 0.5 #seconds of bet-or-roll search per move
+
+    def __init__(self, p1_name:str, p2_name:str, seed:int=None, display:bool=True, rules:CamelUpRules=None):
+        self.rules = rules or CamelUpRules()
+        self._camel_styles = None #loaded with the rendering layer on first use
+        self.seed = seed
+        self.board = CamelUpBoard(None, seed, self.rules)
         self.players =[CamelUpPlayer(p1_name), CamelUpPlayer(p2_name)]
+        self.display = display #False skips printing the board and leg results
+        self.advisor = CamelUpAdvisor(self.board, self.ADVISOR_TIME_BUDGET)
+        self.log = None #a CamelUpLog.GameRecorder records the game when set
+
+    @property
+    def CAMEL_STYLES(self)->dict[str, str]:
+        '''The style of each camel color (see CamelUpRenderer.CAMEL_PALETTE), loaded on first use so that
+           headless games never import the rendering layer
+        '''
+        if self._camel_styles is None:
+            import CamelUpRenderer
+            self._camel_styles = CamelUpRenderer.camel_styles(self.board.camel_colors)
+        return self._camel_styles
     
     def get_player_move(self, player: CamelUpPlayer)->str:
         """Prompts the use to enter a valid menu choice:
             - B or b to place a bet
             - R or r to shake the pyramd
         """ 
+        print(f"AI Advice- {self.describe_recommendation()}")
         print(f"{player.name}-", end =" ")     
         choice = "not_an_option"
         while choice.lower() not in ["b", "r"]:
             choice = input("(B)et or (R)oll? ").lower()
         return choice
     
+    def describe_recommendation(self)->str:
+        '''Searches the rest of the leg for the best move of the player about to play (see CamelUpAdvisor)
+
+           Return
+             str - the recommended move and how many coins it is expected to gain over the opponent this leg
+        '''
+        from CamelUpRenderer import RESET
+
+        advice = self.advisor.recommend()
+        if advice.move == "b":
+            move = f"Bet on {self.CAMEL_STYLES[advice.color]}{advice.color}{RESET}"
+        else:
+            move = "Roll"
+        return f"{move} ({advice.value:+.2f} coins vs opponent this leg, {advice.depth} turns ahead)"
+
     def print_AI_Advice(self):
         '''Prints both the enumerative and experimental probability of each camel coming in 
            first or second place for the current leg of the race
@@ -33,10 +61,15 @@ class CamelUpGame:
            Return
              dict(str, tuple(float, float)) - A dictionary containing the enumerative probabilites for all camels
         '''
-        print("  Enumerative\tExperimental")
+        from CamelUpRenderer import RESET
+
         enum = self.board.run_enumerative_leg_analysis()
-        exper = self.board.run_experimental_leg_analysis(5000)
-        analysis = [(self.CAMEL_STYLES[c]+c+Style.RESET_ALL, enum[c][0],enum[c][1], exper[c][0], exper[c][1])  for c in enum ]
+        # as many trials as fit in the latency budget, stopping early once the estimates are within +/-1%
+        for estimate in self.board.iter_experimental_leg_analysis(tolerance=0.01, time_budget=self.ADVICE_TIME_BUDGET):
+            pass
+        exper = estimate.probabilities
+        print(f"  Enumerative\tExperimental ({estimate.trials} trials)")
+        analysis = [(self.CAMEL_STYLES[c]+c+RESET, enum[c][0],enum[c][1], exper[c][0], exper[c][1])  for c in enum ]
         print("   1st   2nd\t 1st   2nd")
         for row in analysis:
             print("{: >1} {: >5.2f} {: >5.2f} \t{: >5.2f} {: >5.2f}".format(*row))
@@ -69,6 +102,8 @@ class CamelUpGame:
            Also reveals both the enumerative and experimental probabilites of each camel 
            coming in either first or second place, and the expected value of each available betting ticket
         '''
+        from CamelUpRenderer import RESET
+
         print("AI Advice-")
         enum = self.print_AI_Advice()
 
@@ -78,9 +113,9 @@ class CamelUpGame:
             if len(tickets_left) > 0:
                 top_ticket_value=tickets_left[0]
                 ev = self.get_ticket_EV(top_ticket_value, enum[color][0], enum[color][1])
-                available_tickets += f"({color})"+self.CAMEL_STYLES[color]+str(top_ticket_value)+Style.RESET_ALL+f" EV:{ev:.2f} "
+                available_tickets += f"({color})"+self.CAMEL_STYLES[color]+str(top_ticket_value)+RESET+f" EV:{ev:.2f} "
             else:
-                available_tickets += f"({color})"+self.CAMEL_STYLES[color]+"X"+Style.RESET_ALL+" "
+                available_tickets += f"({color})"+self.CAMEL_STYLES[color]+"X"+RESET+" "
         print(available_tickets)
         
         ticket_color = "not_an_option"
@@ -89,55 +124,50 @@ class CamelUpGame:
 
         return ticket_color.lower()
 
-    def play_1_leg(self):
+    def play_leg(self, curr_player:int):
         '''Alternatingly prompts each player to either Bet or Roll until all dice have been 
-           placed on Dice Tents
+           placed on Dice Tents, starting with the player at index curr_player
         '''
-        curr_player = 0
+        if self.log:
+            self.log.checkpoint(curr_player, self.board.state, (self.players[0].money, self.players[1].money))
         while not self.board.is_leg_finished():
-            if self.board.track[15]:
+            if self.board.is_race_finished():
                 break
             player = self.players[curr_player]
             move = self.get_player_move(player)
             match move:
                 case "r":
                     rolled_die = self.board.shake_pyramid()
-                    self.board.move_camel(rolled_die)
+                    self.board._move(rolled_die)
                     player.win_money(1)
+                    if self.log:
+                        self.log.roll(curr_player, self.board.camel_index[rolled_die[0]], rolled_die[1])
                 case "b":
                     ticket_color = self.get_player_bet(player)
                     ticket = self.board.place_bet(ticket_color)
                     player.add_bet(ticket)
-            self.board.print(self.players)
+                    if self.log and ticket:
+                        self.log.bet(curr_player, self.board.camel_index[ticket[0]], ticket[1])
+            if self.display:
+                self.board.print(self.players)
             curr_player = (curr_player + 1) % 2
+
+    def play_1_leg(self):
+        '''Plays a leg of the race with the first player starting'''
+        self.play_leg(0)
+
     def play_2_leg(self):
-        '''Alternatingly prompts each player to either Bet or Roll until all dice have been 
-           placed on Dice Tents
-        '''
-        curr_player = 1
-        while not self.board.is_leg_finished():
-            if self.board.track[15]:
-                break
-            player = self.players[curr_player]
-            move = self.get_player_move(player)
-            match move:
-                case "r":
-                    rolled_die = self.board.shake_pyramid()
-                    self.board.move_camel(rolled_die)
-                    player.win_money(1)
-                case "b":
-                    ticket_color = self.get_player_bet(player)
-                    ticket = self.board.place_bet(ticket_color)
-                    player.add_bet(ticket)
-            self.board.print(self.players)
-            curr_player = (curr_player + 1) % 2
+        '''Plays a leg of the race with the second player starting'''
+        self.play_leg(1)
     
     def leg_payouts_and_results(self):
         '''Calculates and displays the final rankings for a race leg.
         '''
         first, second = self.board.get_rankings()
-        print(f"{self.CAMEL_STYLES[first]}{first}{Style.RESET_ALL} comes in 1st🥇🥇🥇!")
-        print(f"{self.CAMEL_STYLES[second]}{second}{Style.RESET_ALL} comes in 2nd🥈🥈🥈!")
+        if self.display:
+            from CamelUpRenderer import RESET
+            print(f"{self.CAMEL_STYLES[first]}{first}{RESET} comes in 1st🥇🥇🥇!")
+            print(f"{self.CAMEL_STYLES[second]}{second}{RESET} comes in 2nd🥈🥈🥈!")
         for player in self.players:
             for bet in player.bets:
                 if bet[0] == first:
@@ -152,18 +182,28 @@ class CamelUpGame:
         self.players[1].reset_tickets()
         self.board.reset_tents()
         self.board.pyramid = set(self.board.camel_colors)
+        self.advisor.table.clear() #positions of the finished leg can not come up again
+
+    def play_game(self):
+        '''Plays legs, alternating the starting player, until a camel crosses the finish line'''
+        if self.display:
+            self.board.print(self.players)
+        if self.log:
+            self.log.start_game(self.seed, self.board.state)
+        while not self.board.is_race_finished():
+            self.play_1_leg()
+            self.leg_payouts_and_results()
+            self.reset()
+            self.play_2_leg()
+            self.leg_payouts_and_results()
+            self.reset()
+        if self.log:
+            self.log.end((self.players[0].money, self.players[1].money))
         
 if __name__ == "__main__":
     # TODO: enter player names
     camelup = CamelUpGame("p1", "p2")
-    camelup.board.print(camelup.players)
-    while not camelup.board.track[-1]:
-        camelup.play_1_leg()
-        camelup.leg_payouts_and_results()
-        camelup.reset()
-        camelup.play_2_leg()
-        camelup.leg_payouts_and_results()
-        camelup.reset()
+    camelup.play_game()
         
     for player in camelup.players:
         print(f"{player.name} ended the leg with {player.money} coins.")
@@ -0,0 +1,205 @@
+'''Compact binary game logs for replaying and bulk scanning recorded games.
+
+   A log file is a 32 byte header followed by 32 byte records, all little-endian. Every record starts
+   with the same 8 bytes, then a 24 byte payload that depends on its kind:
+
+        kind (u8) | seat (u8) | leg (u16) | move (u32) | payload (24 bytes)
+
+        GAME  - a game starts: seed key (u64, see CamelUpRandom.seed_key), whether the game was seeded (seat),
+                starting state (8 x u16)
+        LEG   - checkpoint at the start of a leg: state (8 x u16), money of each player (2 x i16)
+        ROLL  - the player in seat rolled a die: camel (u8), value (u8)
+        BET   - the player in seat took a ticket: camel (u8), ticket value (u8)
+        END   - the game is over: final money of each player (2 x i16)
+
+   move is the number of moves (rolls and bets) made in the game before the record. Because every leg
+   starts with a checkpoint, any position is rebuilt from at most one leg of records. Records have a fixed
+   width, so the kind of every record in a file is a single strided slice of the memory map.
+'''
+import mmap
+import struct
+
+import CamelUpRandom
+
+MAGIC = b"CUPL"
+VERSION = 1
+RECORD_SIZE = 32
+MAX_CAMELS = 8
+GAME, LEG, ROLL, BET, END = 1, 2, 3, 4, 5
+
+_HEADER = struct.Struct(f"<4sHHH{MAX_CAMELS}s")
+_PREFIX = struct.Struct("<BBHI")
+_PAYLOADS = {
+    GAME: struct.Struct(f"<Q{MAX_CAMELS}H"),
+    LEG: struct.Struct(f"<{MAX_CAMELS}Hhh4x"),
+    ROLL: struct.Struct("<BB22x"),
+    BET: struct.Struct("<BB22x"),
+    END: struct.Struct("<hh20x"),
+}
+
+
+def _codes(state:tuple[int, ...])->tuple[int, ...]:
+    return tuple(state) + (0,)*(MAX_CAMELS-len(state))
+
+
+class GameRecorder:
+    '''Encodes the records of one game in memory. Set as CamelUpGame.log to record a game.'''
+    def __init__(self):
+        self.records = bytearray()
+        self.moves = 0
+        self.legs = 0
+
+    def _append(self, kind:int, seat:int, *payload):
+        self.records += _PREFIX.pack(kind, seat, self.legs, self.moves) + _PAYLOADS[kind].pack(*payload)
+
+    def start_game(self, seed:int, state:tuple[int, ...]):
+        # seeds of any size, including negative ones, are stored as their 64 bit key
+        self._append(GAME, seed is not None, 0 if seed is None else CamelUpRandom.seed_key(seed), *_codes(state))
+
+    def checkpoint(self, seat:int, state:tuple[int, ...], money:tuple[int, int]):
+        '''Records the position at the start of a leg, with seat to move first'''
+        self.legs += 1
+        self._append(LEG, seat, *_codes(state), *money)
+
+    def roll(self, seat:int, camel:int, value:int):
+        self._append(ROLL, seat, camel, value)
+        self.moves += 1
+
+    def bet(self, seat:int, camel:int, value:int):
+        self._append(BET, seat, camel, value)
+        self.moves += 1
+
+    def end(self, money:tuple[int, int]):
+        self._append(END, 0, *money)
+
+
+class GameLogWriter:
+    '''Appends recorded games to a log file, creating it with a header when needed'''
+    def __init__(self, path:str, camel_colors:list[str], track_positions:int=16):
+        if len(camel_colors) > MAX_CAMELS:
+            raise ValueError(f"game logs hold at most {MAX_CAMELS} camels")
+        header = _HEADER.pack(MAGIC, VERSION, len(camel_colors), track_positions, "".join(camel_colors).encode())
+        header += bytes(RECORD_SIZE-len(header))
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(header)
+        else:
+            with open(path, "rb") as file:
+                if file.read(RECORD_SIZE) != header:
+                    self.file.close()
+                    raise ValueError(f"{path} is a log of a different game setup")
+
+    def append(self, records:bytes):
+        '''Writes the records of one or more games (see GameRecorder.records)'''
+        self.file.write(records)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameLog:
+    '''A memory-mapped game log (see GameLogWriter)'''
+    def __init__(self, path:str):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, camels, self.track_positions, colors = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} Camel Up game log")
+        self.camel_colors = list(colors[:camels].decode())
+        # the kind byte of every record, in one pass over the file
+        self.kinds = self._map[RECORD_SIZE::RECORD_SIZE]
+        self.games = self.find(GAME) #record index of the start of each game
+
+    def __len__(self)->int:
+        return len(self.kinds)
+
+    def find(self, kind:int, start:int=0, stop:int=None)->list[int]:
+        '''Returns the index of every record of a kind between start and stop'''
+        stop = len(self.kinds) if stop is None else stop
+        found = []
+        index = self.kinds.find(kind, start, stop)
+        while index != -1:
+            found.append(index)
+            index = self.kinds.find(kind, index+1, stop)
+        return found
+
+    def record(self, index:int)->tuple:
+        '''Returns (kind, seat, leg, move, payload) of the record at index'''
+        offset = RECORD_SIZE*(index+1)
+        kind, seat, leg, move = _PREFIX.unpack_from(self._map, offset)
+        return (kind, seat, leg, move, _PAYLOADS[kind].unpack_from(self._map, offset+_PREFIX.size))
+
+    def game_range(self, game:int)->range:
+        '''Returns the record indices of a game'''
+        stop = self.games[game+1] if game+1 < len(self.games) else len(self.kinds)
+        return range(self.games[game], stop)
+
+    def final_money(self)->list[tuple[int, int]]:
+        '''Returns the final money of the players of every finished game'''
+        return [self.record(index)[4] for index in self.find(END)]
+
+    def rebuild(self, game:int, move:int, rules=None):
+        '''Rebuilds a recorded game as it was right after its first move moves, starting from the
+           checkpoint of that move's leg. Leg payouts happen before the next move, and a move past the
+           end of the game rebuilds the final result. The rebuilt game's random generator is seeded from
+           the recorded seed key and the move, so it does not repeat the recorded rolls after move.
+
+            Args
+               game (int) - the index of the game in the log
+               move (int) - the number of moves (rolls and bets) to replay
+               rules (CamelUpRules) - the rules the game was played with; by default the standard rules
+                                      with the camels and track of the log
+
+            Return
+               CamelUpGame - a game with display off, whose board and players are in the recorded position
+        '''
+        from CamelUpGame import CamelUpGame
+        from CamelUpRules import CamelUpRules
+
+        records = self.game_range(game)
+        key = self.record(records[0])[4][0]
+        camels = len(self.camel_colors)
+        start = records[0]
+        for index in self.find(LEG, records.start, records.stop):
+            # a leg's last move is rebuilt before its payouts, from the previous checkpoint
+            if start != records[0] and self.record(index)[3] >= move:
+                break
+            start = index
+
+        if rules is None:
+            rules = CamelUpRules(camel_colors=self.camel_colors, track_positions=self.track_positions)
+        rebuilt = CamelUpGame("p1", "p2", key*2**32 + move, display=False, rules=rules)
+        board = rebuilt.board
+        if board.camel_colors != self.camel_colors:
+            raise ValueError("the log was recorded with different camels")
+        kind, seat, leg, made, payload = self.record(start)
+        board.state = payload[:camels] if kind == LEG else payload[1:camels+1]
+        if kind == LEG:
+            for player, money in zip(rebuilt.players, payload[MAX_CAMELS:]):
+                player.money = money
+        for index in range(start+1, records.stop):
+            kind, seat, leg, made, payload = self.record(index)
+            if kind == LEG or made >= move:
+                break
+            if kind == END:
+                # the final leg has been paid out
+                for player, money in zip(rebuilt.players, payload):
+                    player.money = money
+                    player.reset_tickets()
+                continue
+            player, die = rebuilt.players[seat], (self.camel_colors[payload[0]], payload[1])
+            if kind == ROLL:
+                board.pyramid.remove(die[0])
+                board.dice_tents.append(die)
+                board._move(die)
+                player.win_money(1)
+            else:
+                player.add_bet(board.place_bet(die[0]))
+        return rebuilt
+
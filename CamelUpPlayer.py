@@ -1,5 +1,3 @@
-from colorama import Fore, Back, Style, init
-
 class CamelUpPlayer:
     def __init__(self, name:str):
         self.money = 3 #Camel Up players start with 3 coins
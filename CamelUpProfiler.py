@@ -0,0 +1,182 @@
+'''Opt-in instrumentation of the Camel Up hot paths.
+
+   While disabled nothing is wrapped, so the instrumented functions run at full speed. enable() swaps
+   timing wrappers in for every function in HOT_PATHS and disable() puts the originals back:
+
+        import CamelUpProfiler
+        CamelUpProfiler.enable()
+        ... play or analyze ...
+        print(CamelUpProfiler.PROFILER.snapshot())
+        CamelUpProfiler.PROFILER.to_csv("profile.csv")
+        CamelUpProfiler.disable()
+
+   For each function the profiler records the number of calls, cumulative and percentile wall times, and
+   the net number of memory blocks allocated (sys.getallocatedblocks). Recursive calls are counted but only
+   the outermost call is timed. Analyses also add counters, such as states visited and sequences evaluated.
+'''
+import functools
+import importlib
+import random
+import sys
+import time
+
+# (module, class or None, function) of every function wrapped by enable()
+HOT_PATHS = [
+    ("CamelUpState", None, "move"),
+    ("CamelUpState", None, "rankings"),
+    ("CamelUpAnalysis", None, "count_leg_outcomes"),
+    ("CamelUpAnalysis", None, "sample_leg_outcomes"),
+    ("CamelUpAnalysis", None, "simulate_leg_outcomes"),
+    ("CamelUpTables", None, "lookup_leg_outcomes"),
+    ("CamelUpBoard", "CamelUpBoard", "move_camel"),
+    ("CamelUpBoard", "CamelUpBoard", "_move"),
+    ("CamelUpBoard", "CamelUpBoard", "shake_pyramid"),
+    ("CamelUpBoard", "CamelUpBoard", "get_rankings"),
+    ("CamelUpBoard", "CamelUpBoard", "get_all_dice_roll_sequences"),
+    ("CamelUpBoard", "CamelUpBoard", "run_enumerative_leg_analysis"),
+    ("CamelUpBoard", "CamelUpBoard", "run_experimental_leg_analysis"),
+    ("CamelUpBoard", "CamelUpBoard", "run_race_analysis"),
+    ("CamelUpBoard", "CamelUpBoard", "print"),
+    ("CamelUpAdvisor", "CamelUpAdvisor", "recommend"),
+    ("CamelUpGame", "CamelUpGame", "print_AI_Advice"),
+    ("CamelUpGame", "CamelUpGame", "play_leg"),
+]
+
+
+class FunctionStats:
+    '''Timings of one instrumented function'''
+    SAMPLES = 10_000 #timings kept for percentiles, by reservoir sampling
+
+    def __init__(self):
+        self.calls = 0
+        self.timed_calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.blocks = 0
+        self.samples = []
+        self.active = 0 #depth of recursion into the function
+
+    def add(self, elapsed:float, blocks:int):
+        self.timed_calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.blocks += blocks
+        if len(self.samples) < self.SAMPLES:
+            self.samples.append(elapsed)
+        else:
+            slot = random.randrange(self.timed_calls)
+            if slot < self.SAMPLES:
+                self.samples[slot] = elapsed
+
+    def percentile(self, fraction:float)->float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered)-1, int(fraction*len(ordered)))]
+
+    def summary(self)->dict[str, float]:
+        return {
+            "calls":self.calls,
+            "total_s":self.total,
+            "mean_s":self.total/self.timed_calls if self.timed_calls else 0.0,
+            "p50_s":self.percentile(0.50),
+            "p90_s":self.percentile(0.90),
+            "p99_s":self.percentile(0.99),
+            "max_s":self.max,
+            "allocated_blocks":self.blocks,
+        }
+
+
+class Profiler:
+    '''Collects function timings and named counters while enabled'''
+    def __init__(self):
+        self.enabled = False
+        self.functions = {}
+        self.counters = {}
+        self._originals = {}
+
+    def wrap(self, name:str, function):
+        '''Returns a wrapper of function that records its timings under name'''
+        stats = self.functions.setdefault(name, FunctionStats())
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stats.calls += 1
+            if stats.active:
+                return function(*args, **kwargs)
+            stats.active += 1
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+                stats.active -= 1
+        return wrapper
+
+    def enable(self):
+        '''Wraps every function in HOT_PATHS'''
+        if self.enabled:
+            return
+        for module_name, class_name, function_name in HOT_PATHS:
+            module = importlib.import_module(module_name)
+            owner = getattr(module, class_name) if class_name else module
+            original = owner.__dict__[function_name]
+            name = f"{class_name or module_name}.{function_name}"
+            self._originals[(owner, function_name)] = original
+            setattr(owner, function_name, self.wrap(name, original))
+        self.enabled = True
+
+    def disable(self):
+        '''Puts the original functions back; the collected data is kept until reset'''
+        for (owner, function_name), original in self._originals.items():
+            setattr(owner, function_name, original)
+        self._originals.clear()
+        self.enabled = False
+
+    def count(self, name:str, amount:int=1):
+        '''Adds amount to a named counter, such as states visited by an analysis'''
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        '''Forgets every timing and counter'''
+        for stats in self.functions.values():
+            # the wrappers hold on to their stats, so they are cleared in place
+            stats.__init__()
+        self.counters.clear()
+
+    def snapshot(self)->dict:
+        '''Returns the timings of every function that has been called and the counters'''
+        return {
+            "functions":{name:stats.summary() for name, stats in sorted(self.functions.items()) if stats.calls},
+            "counters":dict(sorted(self.counters.items())),
+        }
+
+    def to_json(self, path:str=None)->str:
+        '''Returns the snapshot as JSON, also writing it to path when given'''
+        import json
+
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, "w") as file:
+                file.write(text+"\n")
+        return text
+
+    def to_csv(self, path:str):
+        '''Writes one row per function, then one row per counter'''
+        import csv
+
+        snapshot = self.snapshot()
+        columns = ["calls", "total_s", "mean_s", "p50_s", "p90_s", "p99_s", "max_s", "allocated_blocks"]
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name"] + columns)
+            for name, summary in snapshot["functions"].items():
+                writer.writerow([name] + [summary[column] for column in columns])
+            for name, value in snapshot["counters"].items():
+                writer.writerow([name, value] + [""]*(len(columns)-1))
+
+
+PROFILER = Profiler()
+enable = PROFILER.enable
+disable = PROFILER.disable
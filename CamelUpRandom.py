@@ -0,0 +1,160 @@
+'''Counter-based random numbers for reproducible games and simulations.
+
+   Draw number i of a generator is a hash of (key, i) (the SplitMix64 finalizer), instead of the next
+   step of a sequential state. Any draw can be computed directly, without the ones before it, so:
+
+        - trial i of a simulation always uses draw i, whichever process, shard or batch simulates it,
+          and serial, parallel and batched simulations give bit-identical counts for the same seed
+        - NumPy computes the draws of a whole batch of trials at once from an array of indices
+
+   One draw decides everything random in a leg: the order of the dice and the value of each die are
+   the mixed-radix digits of a single number below dice! * faces**dice (see leg_draw).
+'''
+import math
+import os
+import random
+
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15 #the SplitMix64 increment
+MAX_LEG_SPACE = 2**32 #leg_draws decodes at most this many outcomes per draw
+
+
+def mix64(z:int)->int:
+    '''The SplitMix64 finalizer: a bijective hash of a 64 bit int'''
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & MASK64
+    return z ^ (z >> 31)
+
+
+def seed_key(seed)->int:
+    '''Returns the 64 bit key of a seed: an int of any size, or None for a random key'''
+    if seed is None:
+        return int.from_bytes(os.urandom(8), "little")
+    seed = int(seed)
+    if seed < 0:
+        # a negative seed's words never run out, so it is keyed from its complement instead
+        return mix64(seed_key(~seed) ^ GOLDEN)
+    key = 0
+    while True:
+        key = mix64(key ^ (seed & MASK64))
+        seed >>= 64
+        if not seed:
+            return key
+
+
+def counter_value(key:int, index:int)->int:
+    '''Returns draw number index of the generator with key'''
+    return mix64((key + (index+1)*GOLDEN) & MASK64)
+
+
+def leg_space(dice:int, faces:int)->tuple[int, int]:
+    '''Returns the number of dice orders and the number of (order, values) outcomes of a leg'''
+    orders = math.factorial(dice)
+    return orders, orders * faces**dice
+
+
+def leg_draw(key:int, index:int, dice:int, faces:int)->tuple[int, list[int]]:
+    '''Decodes draw number index into the outcome of a leg
+
+        Args
+           key (int) - the generator key
+           index (int) - the draw number, e.g. the trial number
+           dice (int) - the number of dice rolled in the leg
+           faces (int) - the number of faces of each die
+
+        Return
+           tuple[int, list[int]] - the index of the dice order in itertools.permutations order,
+                                   and the face index rolled by each die, in roll order
+    '''
+    orders, space = leg_space(dice, faces)
+    outcome = counter_value(key, index) * space >> 64
+    order, outcome = outcome % orders, outcome // orders
+    values = []
+    for die in range(dice):
+        values.append(outcome % faces)
+        outcome //= faces
+    return order, values
+
+
+def leg_draws(key:int, indices, dice:int, faces:int):
+    '''NumPy version of leg_draw for an array of draw numbers, with identical results
+
+        Return
+           tuple[numpy.ndarray, numpy.ndarray] - the dice order of each draw, and the face indices
+                                                 with shape (dice, draws)
+    '''
+    import numpy as np
+
+    orders, space = leg_space(dice, faces)
+    if space >= MAX_LEG_SPACE:
+        raise ValueError(f"{dice} dice with {faces} faces have too many outcomes for one vectorized draw")
+    z = np.uint64(key) + (np.asarray(indices, dtype=np.uint64) + np.uint64(1)) * np.uint64(GOLDEN)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    # the high 64 bits of z * space, from the two 32 bit halves of z
+    space = np.uint64(space)
+    low = (z & np.uint64(0xFFFFFFFF)) * space >> np.uint64(32)
+    outcome = ((z >> np.uint64(32)) * space + low) >> np.uint64(32)
+    order = (outcome % np.uint64(orders)).astype(np.intp)
+    outcome //= np.uint64(orders)
+    values = np.empty((dice, len(order)), dtype=np.intp)
+    for die in range(dice):
+        values[die] = outcome % np.uint64(faces)
+        outcome //= np.uint64(faces)
+    return order, values
+
+
+class CounterRandom(random.Random):
+    '''A random.Random whose numbers come from counter_value, so every method of random.Random
+       (randint, choice, sample, ...) is reproducible from the seed and the counter alone
+    '''
+    def __init__(self, seed=None):
+        super().__init__(seed)
+
+    def seed(self, a=None, version:int=2):
+        self.key = seed_key(a)
+        self.counter = 0
+
+    def getstate(self)->tuple[int, int]:
+        return (self.key, self.counter)
+
+    def setstate(self, state:tuple[int, int]):
+        self.key, self.counter = state
+
+    def next64(self)->int:
+        value = counter_value(self.key, self.counter)
+        self.counter += 1
+        return value
+
+    def random(self)->float:
+        return (self.next64() >> 11) * 2.0**-53
+
+    def getrandbits(self, k:int)->int:
+        bits = 0
+        for shift in range(0, k, 64):
+            bits |= self.next64() << shift
+        return bits & ((1 << k) - 1)
+
+    def take(self, draws:int)->int:
+        '''Reserves the next draws draw numbers and returns the first one'''
+        first = self.counter
+        self.counter += draws
+        return first
+
+    def jumped(self, counter:int):
+        '''Returns a generator with the same key, positioned at draw number counter'''
+        other = CounterRandom.__new__(CounterRandom)
+        other.setstate((self.key, counter))
+        return other
+
+    def spawn(self, stream:int):
+        '''Returns an independent generator, for example to keep analyses from using up game rolls'''
+        other = CounterRandom.__new__(CounterRandom)
+        other.setstate((mix64(self.key ^ mix64(stream+1)), 0))
+        return other
+
+
+def as_random(seed)->CounterRandom:
+    '''Returns seed itself when it is a CounterRandom, or a new CounterRandom seeded with it'''
+    return seed if isinstance(seed, CounterRandom) else CounterRandom(seed)
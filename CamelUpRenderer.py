@@ -0,0 +1,140 @@
+'''Fast text rendering of a CamelUpBoard, for the terminal and for logs.
+
+   A frame is built in one pass from cached pieces: the styled text of every camel, ticket and die is
+   built once, and the lines of the track, the tents and the players are only rebuilt when what they
+   show has changed since the previous frame. redraw() goes further for terminals spectating a game,
+   writing only the lines that differ from the frame already on screen.
+
+   This is the only module of the engine that imports colorama. Boards and games import it on their
+   first print, so headless games and analysis workers never pay for loading it.
+'''
+from colorama import Back, Fore, Style
+
+import CamelUpState
+
+RESET = Style.RESET_ALL
+# the style of every camel color a variant can use
+CAMEL_PALETTE = {
+    "r": Back.RED+Style.BRIGHT,
+    "b": Back.BLUE+Style.BRIGHT,
+    "g": Back.GREEN+Style.BRIGHT,
+    "y": Back.YELLOW+Style.BRIGHT,
+    "p": Back.MAGENTA,
+    "c": Back.CYAN+Style.BRIGHT,
+    "w": Back.WHITE+Fore.BLACK,
+    "o": Back.LIGHTRED_EX+Fore.BLACK,
+}
+
+
+def camel_styles(camel_colors:list[str])->dict[str, str]:
+    '''Returns the style of each camel color from CAMEL_PALETTE'''
+    missing = [color for color in camel_colors if color not in CAMEL_PALETTE]
+    if missing:
+        raise ValueError(f"no style for camel colors {missing}")
+    return {color:CAMEL_PALETTE[color] for color in camel_colors}
+
+
+class BoardRenderer:
+    '''Renders frames of one board (see CamelUpBoard.print for the layout)'''
+    def __init__(self, camel_styles:dict[str, str], track_positions:int=16, color:bool=True):
+        '''
+            Args
+               camel_styles (dict[str, str]) - the colorama style of each camel color
+               track_positions (int) - the number of spaces on the track
+               color (bool) - False renders plain text without any escape codes, for log output
+        '''
+        self.camel_colors = list(camel_styles)
+        self.track_positions = track_positions
+        self.color = color
+        self._styles = {camel:style if color else "" for camel, style in camel_styles.items()}
+        self._reset = Style.RESET_ALL if color else ""
+        self._styled = {} #the styled text of a camel, ticket or die, keyed on (color, text)
+        self._empty_die = (Back.WHITE+" "+self._reset if color else "-") + " "
+        self._numbers = ("   " + "".join(str(i) + ("   " if i < 10 else "  ") for i in range(1, track_positions+1))
+                         + "\n")
+        self._columns = {} #stack of camels -> the cell shown in each row, bottom row first
+        self._lines = {} #part of the frame -> (what it shows, its text)
+        self._screen = None #lines of the last frame written by redraw
+
+    def styled(self, camel:str, text:str)->str:
+        '''Returns text in the style of a camel. Without color, text other than the camel's own letter is
+           prefixed with the letter (e.g. "r5"), so tickets, dice and bets still show whose they are
+        '''
+        key = (camel, text)
+        styled = self._styled.get(key)
+        if styled is None:
+            if not self.color and text != camel:
+                text = camel + text
+            styled = self._styles[camel] + text + self._reset
+            self._styled[key] = styled
+        return styled
+
+    def _line(self, part:str, shows, build)->str:
+        '''Returns the cached text of a part of the frame, rebuilding it when what it shows has changed'''
+        cached = self._lines.get(part)
+        if cached is None or cached[0] != shows:
+            cached = (shows, build())
+            self._lines[part] = cached
+        return cached[1]
+
+    def _column(self, stack:tuple[str, ...])->list[str]:
+        cells = self._columns.get(stack)
+        if cells is None:
+            cells = [self.styled(camel, camel) for camel in stack]
+            cells += [" "]*(len(self.camel_colors) - len(stack))
+            self._columns[stack] = cells
+        return cells
+
+    def _tents(self, board)->str:
+        tickets = "".join(self.styled(color, str(tickets[0]) if tickets else "X") + " "
+                          for color, tickets in board.ticket_tents.items())
+        dice = "".join(self.styled(color, str(value)) + " " for color, value in board.dice_tents)
+        dice += self._empty_die*(len(self.camel_colors) - len(board.dice_tents))
+        return "Ticket Tents: " + tickets + "\t\tDice Tents: " + dice + "\n"
+
+    def _track(self, state:tuple[int, ...], camel_colors:list[str])->str:
+        columns = [self._column(tuple(stack)) for stack in CamelUpState.decode_state(state, camel_colors,
+                                                                                     self.track_positions)]
+        rows = []
+        for row in range(len(self.camel_colors)-1, -1, -1):
+            rows.append("🌴 " + "   ".join([cells[row] for cells in columns]) + " |🏁\n")
+        return "".join(rows)
+
+    def _players(self, players)->str:
+        parts = []
+        for player in players:
+            parts.append(f"{player.name} has {player.money} coins.")
+            if player.bets:
+                parts.append(" Bets: " + " ".join([self.styled(color, str(value)) for color, value in player.bets]))
+            parts.append("\t\t")
+        return "".join(parts)
+
+    def frame(self, board, players:list)->list[str]:
+        '''Returns the parts of a frame: the tents, the track, the space numbers and the players'''
+        tents = (tuple(tuple(tickets[:1]) for tickets in board.ticket_tents.values()), tuple(board.dice_tents))
+        holdings = tuple((player.name, player.money, tuple(player.bets)) for player in players)
+        return [
+            self._line("tents", tents, lambda: self._tents(board)),
+            self._line("track", board.state, lambda: self._track(board.state, board.camel_colors)),
+            self._numbers,
+            self._line("players", holdings, lambda: self._players(players)),
+        ]
+
+    def render(self, board, players:list)->str:
+        '''Returns the full text of a frame, as printed by CamelUpBoard.print'''
+        return "\n" + "".join(self.frame(board, players)) + "\n"
+
+    def redraw(self, board, players:list)->str:
+        '''Returns the terminal output that turns the last frame written by redraw into this one:
+           the cursor moves back to the top of the frame and only the lines that changed are rewritten.
+           The first call returns the whole frame.
+        '''
+        lines = "".join(self.frame(board, players)).split("\n")
+        if self._screen is None or len(self._screen) != len(lines):
+            self._screen = lines
+            return "\n".join(lines) + "\n"
+        output = [f"\x1b[{len(lines)}A"]
+        for old, new in zip(self._screen, lines):
+            output.append("\n" if old == new else "\x1b[2K" + new + "\n")
+        self._screen = lines
+        return "".join(output)
@@ -0,0 +1,82 @@
+'''The rules of a Camel Up variant: the camels, the track, the dice and the betting tickets, and how
+   much work the leg analyses may spend on them.
+
+   The standard game is CamelUpRules(). Variants change any of its arguments, e.g. seven camels on a
+   longer track:
+
+        CamelUpRules(camel_colors="rbgypcw", track_positions=24)
+
+   Counting every dice sequence of a leg grows factorially with the number of dice in the pyramid
+   (n! * faces**n sequences). Exact analyses are only run when the search fits exact_search_limit (see
+   exact_search_size); larger legs are sampled instead, in batches of sample_batch_size trials so memory
+   stays bounded, for at most sample_trials trials or sample_time_budget seconds. Sampled legs are drawn
+   in one vectorized draw each (see CamelUpRandom.leg_draws), which bounds the camels and die faces.
+'''
+import CamelUpAnalysis
+import CamelUpRandom
+
+MAX_CAMELS = 8 #the most camels the renderer palette, the game logs and the leg samplers support
+
+
+class CamelUpRules:
+    '''The rules of a Camel Up variant and the analysis budgets for its legs'''
+    def __init__(self, camel_colors="rbgyp", track_positions:int=16, dice_values=(1, 2, 3),
+                 ticket_values=(5, 3, 2, 2), start_spaces:int=3, exact_search_limit:int=2_000_000,
+                 sample_trials:int=200_000, sample_time_budget:float=1.0, sample_batch_size:int=65_536,
+                 sample_estimator:str="stratified"):
+        '''
+            Args
+               camel_colors (str | list[str]) - one single letter color per camel
+               track_positions (int) - the number of spaces on the track; the last one is the finish line
+               dice_values (tuple[int, ...]) - the faces of each die
+               ticket_values (tuple[int, ...]) - the betting tickets of each Ticket Tent, top ticket first
+               start_spaces (int) - camels start on a random space among the first start_spaces
+               exact_search_limit (int) - the most subtrees an exact leg analysis may solve
+               sample_trials (int) - the trials simulated when a leg is too large for an exact analysis
+               sample_time_budget (float) - stop sampling after this many seconds (at least one batch runs)
+               sample_batch_size (int) - the most trials simulated at once
+               sample_estimator (str) - the variance reduction of the sampled analyses
+                                        (see CamelUpAnalysis.estimator_options)
+        '''
+        self.camel_colors = tuple(camel_colors)
+        self.track_positions = track_positions
+        self.dice_values = tuple(dice_values)
+        self.ticket_values = tuple(ticket_values)
+        self.start_spaces = start_spaces
+        self.exact_search_limit = exact_search_limit
+        self.sample_trials = sample_trials
+        self.sample_time_budget = sample_time_budget
+        self.sample_batch_size = sample_batch_size
+        self.sample_estimator = sample_estimator
+
+        if not 2 <= len(self.camel_colors) <= MAX_CAMELS:
+            raise ValueError(f"a race needs between 2 and {MAX_CAMELS} camels")
+        if len(set(self.camel_colors)) != len(self.camel_colors) or any(len(color) != 1 for color in self.camel_colors):
+            raise ValueError("camel colors must be distinct single letters")
+        if not 1 <= start_spaces < track_positions:
+            raise ValueError("camels must start before the finish line")
+        if not self.dice_values or min(self.dice_values) < 1:
+            raise ValueError("dice faces must be positive")
+        if CamelUpRandom.leg_space(len(self.camel_colors), len(self.dice_values))[1] >= CamelUpRandom.MAX_LEG_SPACE:
+            raise ValueError(f"a leg of {len(self.camel_colors)} dice with {len(self.dice_values)} faces has too many "
+                             f"outcomes to sample")
+        CamelUpAnalysis.estimator_options(sample_estimator)
+
+    @property
+    def last(self)->int:
+        '''The index of the last space of the track'''
+        return self.track_positions - 1
+
+    def exact_search_size(self, dice:int)->int:
+        '''Returns the most subtrees an exact analysis of a leg with dice in the pyramid solves
+           (see CamelUpAnalysis.leg_search_size)
+        '''
+        return CamelUpAnalysis.leg_search_size(dice, len(self.dice_values))
+
+    def is_exact_tractable(self, dice:int)->bool:
+        '''Whether a leg with dice in the pyramid is analyzed exactly rather than sampled'''
+        return self.exact_search_size(dice) <= self.exact_search_limit
+
+    def __repr__(self)->str:
+        return (f"CamelUpRules(camel_colors={''.join(self.camel_colors)!r}, track_positions={self.track_positions}, "
+                f"dice_values={self.dice_values}, ticket_values={self.ticket_values})")
@@ -0,0 +1,261 @@
+'''Headless self-play: runs complete Camel Up games between policy objects, with no terminal I/O.
+
+        python CamelUpSelfPlay.py --games 10000 --workers 8 --policies greedy-ev always-roll
+'''
+import random
+import time
+from collections import Counter
+
+from CamelUpGame import CamelUpGame
+from CamelUpPlayer import CamelUpPlayer
+from CamelUpRules import CamelUpRules
+import CamelUpAnalysis
+import CamelUpProfiler
+import CamelUpLog
+
+
+class CamelUpPolicy:
+    '''Decides the moves of one CamelUpPlayer. Subclasses override choose_move and choose_bet.'''
+    name = "policy"
+
+    def choose_move(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        '''Returns "r" to shake the pyramid or "b" to place a bet'''
+        return "r"
+
+    def choose_bet(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        '''Returns the color of an available betting ticket'''
+        return available_bets(game)[0]
+
+
+class AlwaysRollPolicy(CamelUpPolicy):
+    '''Always shakes the pyramid, taking the guaranteed coin'''
+    name = "always-roll"
+
+
+class RandomPolicy(CamelUpPolicy):
+    '''Rolls or bets at random, betting on a random available ticket.
+       Draws from the board's random generator, so a seeded game replays the same way.
+    '''
+    name = "random"
+
+    def choose_move(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        return game.board.rng.choice(["r", "b"])
+
+    def choose_bet(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        return game.board.rng.choice(available_bets(game))
+
+
+class GreedyEVPolicy(CamelUpPolicy):
+    '''Takes the available ticket with the best expected value (see CamelUpGame.get_ticket_EV) when it is
+       worth more than the 1 coin earned by rolling, and rolls otherwise
+    '''
+    name = "greedy-ev"
+
+    def best_bet(self, game:CamelUpGame)->tuple[str, float]:
+        enum = game.board.run_enumerative_leg_analysis()
+        best = ("", float("-inf"))
+        for color in available_bets(game):
+            ev = game.get_ticket_EV(game.board.ticket_tents[color][0], enum[color][0], enum[color][1])
+            if ev > best[1]:
+                best = (color, ev)
+        return best
+
+    def choose_move(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        return "b" if self.best_bet(game)[1] > 1 else "r"
+
+    def choose_bet(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        return self.best_bet(game)[0]
+
+
+class ExpectimaxPolicy(CamelUpPolicy):
+    '''Follows the game's bet-or-roll advisor (see CamelUpAdvisor), with a small search budget per move'''
+    name = "expectimax"
+
+    def __init__(self, time_budget:float=0.02):
+        self.time_budget = time_budget
+
+    def choose_move(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        game.advisor.time_budget = self.time_budget
+        self.recommendation = game.advisor.recommend()
+        return self.recommendation.move
+
+    def choose_bet(self, game:CamelUpGame, player:CamelUpPlayer)->str:
+        return self.recommendation.color or available_bets(game)[0]
+
+
+POLICIES = {policy.name:policy for policy in [AlwaysRollPolicy, RandomPolicy, GreedyEVPolicy, ExpectimaxPolicy]}
+
+
+def available_bets(game:CamelUpGame)->list[str]:
+    '''Returns the colors whose Ticket Tent still has tickets'''
+    return [color for color, tickets in game.board.ticket_tents.items() if tickets]
+
+
+class HeadlessCamelUpGame(CamelUpGame):
+    '''A CamelUpGame whose players are policy objects instead of people at a terminal'''
+    def __init__(self, policies:list[CamelUpPolicy], seed:int=None, rules:CamelUpRules=None):
+        super().__init__(policies[0].name, policies[1].name, seed, display=False, rules=rules)
+        self.policies = policies
+
+    def get_player_move(self, player:CamelUpPlayer)->str:
+        move = self.policies[self.players.index(player)].choose_move(self, player)
+        if move == "b" and not available_bets(self):
+            return "r"
+        return move
+
+    def get_player_bet(self, player:CamelUpPlayer)->str:
+        return self.policies[self.players.index(player)].choose_bet(self, player)
+
+
+def play_game(policies:list[CamelUpPolicy], seed:int=None, recorder:CamelUpLog.GameRecorder=None,
+              rules:CamelUpRules=None)->tuple[int, int]:
+    '''Plays one complete headless game
+
+        Args
+           policies (list[CamelUpPolicy]) - the policy of each of the two players
+           seed (int) - seed for the starting positions and dice
+           recorder (CamelUpLog.GameRecorder) - records the game's moves when given
+           rules (CamelUpRules) - the variant to play; by default the standard game
+
+        Return
+           tuple[int, int] - the money each player ended the game with
+    '''
+    game = HeadlessCamelUpGame(policies, seed, rules)
+    game.board.analysis_cache = CamelUpAnalysis.shared_leg_cache(game.rules.last, game.rules.dice_values)
+    game.log = recorder
+    game.play_game()
+    return (game.players[0].money, game.players[1].money)
+
+
+def _play_games(task:tuple)->tuple[list[tuple[int, int]], bytes]:
+    '''Process pool task: plays the games for a chunk of seeds, returning their results and,
+       when recording, the log records of every game in seed order
+    '''
+    policies, seeds, record, rules = task
+    results, records = [], bytearray()
+    for seed in seeds:
+        recorder = CamelUpLog.GameRecorder() if record else None
+        results.append(play_game(policies, seed, recorder, rules))
+        if record:
+            records += recorder.records
+    return results, bytes(records)
+
+
+class SelfPlayStats:
+    '''Aggregate results of many self-played games'''
+    def __init__(self, policies:list[CamelUpPolicy]):
+        self.names = [policy.name for policy in policies]
+        self.games = 0
+        self.wins = Counter() #by policy name, ties count for nobody
+        self.ties = 0
+        self.money = [Counter(), Counter()] #final money -> number of games, by seat
+        self.elapsed = 0.0
+
+    def add(self, results:list[tuple[int, int]]):
+        for money in results:
+            self.games += 1
+            self.money[0][money[0]] += 1
+            self.money[1][money[1]] += 1
+            if money[0] == money[1]:
+                self.ties += 1
+            else:
+                self.wins[self.names[0 if money[0] > money[1] else 1]] += 1
+
+    def win_rates(self)->dict[str, float]:
+        '''Returns the share of games won by each seat's policy'''
+        return {name:self.wins[name]/max(self.games, 1) for name in dict.fromkeys(self.names)}
+
+    def mean_money(self)->list[float]:
+        '''Returns the average final money of each seat'''
+        return [sum(amount*count for amount, count in seat.items())/max(self.games, 1) for seat in self.money]
+
+    def games_per_second(self)->float:
+        return self.games/self.elapsed if self.elapsed else 0.0
+
+    def summary(self)->str:
+        rates = " ".join(f"{name}:{rate:.3f}" for name, rate in self.win_rates().items())
+        money = " ".join(f"{amount:.2f}" for amount in self.mean_money())
+        return (f"{self.games} games, {self.games_per_second():.1f} games/sec | win rates {rates} "
+                f"ties:{self.ties/max(self.games, 1):.3f} | mean money {money}")
+
+
+def run_games(games:int, policies:list[CamelUpPolicy], seed:int=None, workers:int=None, chunk_size:int=100,
+              log_path:str=None, rules:CamelUpRules=None):
+    '''Plays games complete headless games, yielding updated aggregate stats after each chunk of games.
+       Game i is seeded from (seed, i), so a seeded run gives the same stats for any number of workers.
+
+        Args
+           games (int) - the number of games to play
+           policies (list[CamelUpPolicy]) - the policy of each of the two players
+           seed (int) - root seed of the games
+           workers (int) - play the chunks on this many worker processes; None or 1 plays them in this process
+           chunk_size (int) - the number of games in each task
+           log_path (str) - append every game, in seed order, to this game log (see CamelUpLog)
+           rules (CamelUpRules) - the variant to play; by default the standard game
+
+        Yield
+           SelfPlayStats - the running aggregate, updated with the results of one more chunk
+    '''
+    if seed is None:
+        seed = random.randrange(2**32)
+    seeds = [seed << 32 | i for i in range(games)]
+    rules = rules or CamelUpRules()
+    tasks = [(policies, seeds[start:start+chunk_size], bool(log_path), rules) for start in range(0, games, chunk_size)]
+    stats = SelfPlayStats(policies)
+    log = CamelUpLog.GameLogWriter(log_path, rules.camel_colors, rules.track_positions) if log_path else None
+    start = time.perf_counter()
+    try:
+        if workers and workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunks = pool.map(_play_games, tasks)
+                for results, records in chunks:
+                    stats.add(results)
+                    if log:
+                        log.append(records)
+                    stats.elapsed = time.perf_counter() - start
+                    yield stats
+        else:
+            for task in tasks:
+                results, records = _play_games(task)
+                stats.add(results)
+                if log:
+                    log.append(records)
+                stats.elapsed = time.perf_counter() - start
+                yield stats
+    finally:
+        if log:
+            log.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs headless Camel Up games between two policies")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--policies", nargs=2, choices=sorted(POLICIES), default=["greedy-ev", "always-roll"])
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--log", help="append every game to this game log")
+    parser.add_argument("--camels", default="rbgyp", help="one letter per camel color, e.g. rbgypcwo for 8 camels")
+    parser.add_argument("--track-positions", type=int, default=16)
+    parser.add_argument("--dice-values", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--profile", help="write hot path timings of this process to a JSON or CSV file")
+    args = parser.parse_args()
+    if args.profile:
+        CamelUpProfiler.enable()
+
+    policies = [POLICIES[name]() for name in args.policies]
+    stats = None
+    rules = CamelUpRules(camel_colors=args.camels, track_positions=args.track_positions, dice_values=args.dice_values)
+    for stats in run_games(args.games, policies, args.seed, args.workers, args.chunk_size, args.log, rules):
+        print(stats.summary(), flush=True)
+    if stats:
+        for seat, money in enumerate(stats.money):
+            print(f"seat {seat+1} ({stats.names[seat]}) money distribution:", dict(sorted(money.items())))
+    if args.profile:
+        if args.profile.endswith(".csv"):
+            CamelUpProfiler.PROFILER.to_csv(args.profile)
+        else:
+            CamelUpProfiler.PROFILER.to_json(args.profile)
@@ -0,0 +1,377 @@
+'''An asyncio server hosting many concurrent Camel Up tables over a line protocol.
+
+        python CamelUpServer.py serve --port 8765 --workers 4
+        python CamelUpServer.py load --port 8765 --clients 200 --games 1000
+
+   Every request is one line and gets one reply line, either "OK <json>", "ERR <message>" or "BUSY":
+
+        NEW [seed]                 -> {"table": id}
+        STATE <table>              -> the track, pyramid, tents, players and the seat to move
+        ROLL <table> <seat>        -> {"die": [color, value], "leg": leg, "to_move": seat, "finished": bool}
+        BET <table> <seat> <color> -> {"ticket": [color, value], "leg": leg, "to_move": seat, "finished": bool}
+        ADVICE <table> [trials]    -> exact and Monte Carlo 1st/2nd place probabilities and ticket EVs
+        METRICS                    -> request counts and latency percentiles by command
+        CLOSE <table>              -> {}
+
+   Every table has its own CamelUpGame, with its own board, random generator and players. Moves are
+   applied on the event loop, while analyses run on a process pool from an immutable snapshot of the
+   table's state, so they never block other tables. When max_pending analyses are already running,
+   ADVICE replies BUSY instead of queueing more work.
+'''
+import asyncio
+import json
+import random
+import time
+
+import CamelUpAnalysis
+import CamelUpTables
+from CamelUpGame import CamelUpGame
+from CamelUpProfiler import FunctionStats
+
+def analyze(task:tuple)->tuple[tuple[int, ...], tuple[int, ...]]:
+    '''Executor task: exact and Monte Carlo 1st/2nd place counts of one table snapshot'''
+    state, mask, last, dice_values, trials, seed = task[:6]
+    exact = CamelUpTables.lookup_leg_outcomes(state, mask, last, dice_values)
+    if exact is None:
+        cache = CamelUpAnalysis.shared_leg_cache(last, dice_values, 1_000_000) #shared by the tables this worker analyzes
+        exact = CamelUpAnalysis.count_leg_outcomes(state, mask, last, dice_values, cache)
+    sampled = CamelUpAnalysis.sample_leg_outcomes(state, mask, trials, last, dice_values, seed)
+    return exact, sampled
+
+
+class TableError(Exception):
+    '''A request that can not be applied to a table; the message is sent back to the client'''
+
+
+class Table:
+    '''One game session, played one move per request in the same turn order as CamelUpGame.play_game'''
+    def __init__(self, seed:int=None):
+        self.game = CamelUpGame("p1", "p2", seed, display=False)
+        self.starter = 0 #the seat that moves first this leg
+        self.leg = 1
+        self.to_move = 0
+        self.finished = False
+
+    def check_turn(self, seat:int):
+        if self.finished:
+            raise TableError("the race is over")
+        if seat != self.to_move:
+            raise TableError(f"seat {self.to_move} is to move")
+
+    def roll(self, seat:int)->tuple[str, int]:
+        self.check_turn(seat)
+        board = self.game.board
+        die = board.shake_pyramid()
+        board._move(die)
+        self.game.players[seat].win_money(1)
+        self.advance()
+        return die
+
+    def bet(self, seat:int, color:str)->tuple[str, int]:
+        self.check_turn(seat)
+        if not self.game.board.ticket_tents.get(color):
+            raise TableError(f"no tickets left for {color!r}")
+        ticket = self.game.board.place_bet(color)
+        self.game.players[seat].add_bet(ticket)
+        self.advance()
+        return ticket
+
+    def advance(self):
+        '''Passes the turn, paying out the leg when it is over'''
+        board = self.game.board
+        self.to_move = 1 - self.to_move
+        if board.is_leg_finished() or board.is_race_finished():
+            self.game.leg_payouts_and_results()
+            self.game.reset()
+            self.finished = board.is_race_finished()
+            self.starter = 1 - self.starter
+            self.leg += 1
+            self.to_move = self.starter
+
+    def describe(self)->dict:
+        board = self.game.board
+        return {
+            "track":board.track,
+            "pyramid":sorted(board.pyramid),
+            "dice_tents":board.dice_tents,
+            "ticket_tents":board.ticket_tents,
+            "players":[{"money":player.money, "bets":player.bets} for player in self.game.players],
+            "leg":self.leg,
+            "to_move":self.to_move,
+            "finished":self.finished,
+        }
+
+    def snapshot(self, trials:int, seed:int)->tuple:
+        '''The table as one ADVICE sees it: the analyze task, then the top ticket of each camel (None when its tent
+           is empty), read together so that moves made while the analysis runs do not change the reply
+        '''
+        board = self.game.board
+        tickets = tuple(board.ticket_tents[color][0] if board.ticket_tents[color] else None for color in board.camel_colors)
+        return (board.state, board.pyramid_mask(), board.TRACK_POSITIONS-1, tuple(board.DICE_VALUES), trials, seed, tickets)
+
+
+class CamelUpServer:
+    '''Hosts tables for any number of connections. Use serve() to listen on a local socket.'''
+    def __init__(self, executor=None, max_tables:int=100_000, max_pending:int=64, advice_trials:int=2_000):
+        '''
+            Args
+               executor (concurrent.futures.Executor) - runs the analyses; None starts a process pool on first use
+               max_tables (int) - the most tables open at once
+               max_pending (int) - the most analyses running or queued at once before ADVICE replies BUSY
+               advice_trials (int) - the default number of Monte Carlo trials per ADVICE
+        '''
+        self.executor = executor
+        self.max_tables = max_tables
+        self.max_pending = max_pending
+        self.advice_trials = advice_trials
+        self.tables = {}
+        self.next_table = 1
+        self.pending = 0
+        self.rejected = 0
+        self.latency = {} #command -> FunctionStats of its reply times
+        self.connections = set() #the tasks serving open connections
+
+    async def handle(self, line:str)->str:
+        '''Applies one request line and returns the reply line'''
+        start = time.perf_counter()
+        words = line.split()
+        command = words[0].upper() if words else ""
+        try:
+            if command not in COMMANDS:
+                raise TableError(f"unknown command {command!r}")
+            reply = await getattr(self, "do_"+command.lower())(*words[1:])
+        except TableError as error:
+            reply = f"ERR {error}"
+        except (TypeError, ValueError):
+            reply = f"ERR bad arguments for {command}"
+        except Exception as error:
+            # e.g. a crashed analysis worker: fail this request but keep the connection open
+            reply = f"ERR {command} failed: {type(error).__name__}"
+        stats = self.latency.setdefault(command if command in COMMANDS else "?", FunctionStats())
+        stats.calls += 1
+        stats.add(time.perf_counter() - start, 0)
+        return reply
+
+    def table(self, table_id:str)->Table:
+        table = self.tables.get(int(table_id))
+        if table is None:
+            raise TableError(f"no table {table_id}")
+        return table
+
+    async def do_new(self, seed:str=None)->str:
+        if len(self.tables) >= self.max_tables:
+            raise TableError("too many open tables")
+        table_id = self.next_table
+        self.next_table += 1
+        self.tables[table_id] = Table(None if seed is None else int(seed))
+        return "OK " + json.dumps({"table":table_id})
+
+    async def do_state(self, table_id:str)->str:
+        return "OK " + json.dumps(self.table(table_id).describe())
+
+    async def do_roll(self, table_id:str, seat:str)->str:
+        table = self.table(table_id)
+        die = table.roll(int(seat))
+        return "OK " + json.dumps({"die":die, "leg":table.leg, "to_move":table.to_move, "finished":table.finished})
+
+    async def do_bet(self, table_id:str, seat:str, color:str)->str:
+        table = self.table(table_id)
+        ticket = table.bet(int(seat), color)
+        return "OK " + json.dumps({"ticket":ticket, "leg":table.leg, "to_move":table.to_move,
+                                   "finished":table.finished})
+
+    async def do_advice(self, table_id:str, trials:str=None)->str:
+        table = self.table(table_id)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return "BUSY"
+        trials = int(trials or self.advice_trials)
+        if trials < 1:
+            raise TableError("trials must be at least 1")
+        task = table.snapshot(trials, random.randrange(2**32))
+        if self.executor is None:
+            self.start_workers()
+        self.pending += 1
+        try:
+            exact, sampled = await asyncio.get_running_loop().run_in_executor(self.executor, analyze, task)
+        finally:
+            self.pending -= 1
+
+        game = table.game
+        colors = game.board.camel_colors
+        n = len(colors)
+        sequences, trials, tickets = sum(exact[:n]), task[4], task[6]
+        advice = {"exact":{}, "experimental":{}, "ev":{}, "trials":trials}
+        for i, color in enumerate(colors):
+            first, second = exact[i]/sequences, exact[n+i]/sequences
+            advice["exact"][color] = (first, second)
+            advice["experimental"][color] = (sampled[i]/trials, sampled[n+i]/trials)
+            if tickets[i] is not None:
+                advice["ev"][color] = game.get_ticket_EV(tickets[i], first, second)
+        return "OK " + json.dumps(advice)
+
+    async def do_metrics(self)->str:
+        return "OK " + json.dumps({
+            "tables":len(self.tables),
+            "pending":self.pending,
+            "rejected":self.rejected,
+            "latency":{command:stats.summary() for command, stats in sorted(self.latency.items())},
+        })
+
+    async def do_close(self, table_id:str)->str:
+        self.table(table_id)
+        del self.tables[int(table_id)]
+        return "OK {}"
+
+    async def connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        '''Serves one client: requests are answered in order, one at a time, so a client that does not
+           read its replies stops being read from
+        '''
+        self.connections.add(asyncio.current_task())
+        try:
+            while line := await reader.readline():
+                writer.write((await self.handle(line.decode()) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    def start_workers(self):
+        '''Starts the analysis workers, creating a process pool when there is no executor. A forked worker
+           inherits every socket open at the time and keeps it open, so a client that closes its connection
+           would never be seen to: the workers are started before the first connection is accepted
+        '''
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor()
+        self.executor.submit(int).result() #a fork pool starts all its workers on the first task
+
+    async def listen(self, host:str="127.0.0.1", port:int=8765, path:str=None)->asyncio.Server:
+        '''Starts listening on a TCP port, or on a Unix socket when path is given, and returns the listener'''
+        self.start_workers()
+        if path:
+            return await asyncio.start_unix_server(self.connection, path)
+        return await asyncio.start_server(self.connection, host, port)
+
+    async def serve(self, host:str="127.0.0.1", port:int=8765, path:str=None):
+        '''Listens until cancelled (see listen)'''
+        async with await self.listen(host, port, path) as server:
+            await server.serve_forever()
+
+
+COMMANDS = {"NEW", "STATE", "ROLL", "BET", "ADVICE", "METRICS", "CLOSE"}
+
+
+async def simulated_client(connect, games:int, advice_every:int, latencies:list[float], rng:random.Random)->dict:
+    '''Plays games games with random moves over one connection, asking for advice every advice_every moves
+
+        Return
+           dict - the number of games, moves, advice replies and BUSY replies
+    '''
+    reader, writer = await connect()
+    totals = {"games":0, "moves":0, "advice":0, "busy":0}
+
+    async def request(line:str)->str:
+        start = time.perf_counter()
+        writer.write((line+"\n").encode())
+        await writer.drain()
+        reply = (await reader.readline()).decode().rstrip("\n")
+        latencies.append(time.perf_counter() - start)
+        if reply.startswith("ERR"):
+            raise RuntimeError(f"{line} -> {reply}")
+        return reply
+
+    for game in range(games):
+        table = json.loads((await request(f"NEW {rng.randrange(2**32)}"))[3:])["table"]
+        state = json.loads((await request(f"STATE {table}"))[3:])
+        leg, to_move, finished, tents = state["leg"], state["to_move"], state["finished"], state["ticket_tents"]
+        while not finished:
+            if advice_every and totals["moves"] % advice_every == 0:
+                reply = await request(f"ADVICE {table}")
+                totals["busy" if reply == "BUSY" else "advice"] += 1
+            colors = [color for color, tickets in tents.items() if tickets]
+            if colors and rng.random() < 0.3:
+                color = rng.choice(colors)
+                move = json.loads((await request(f"BET {table} {to_move} {color}"))[3:])
+                tents[color] = tents[color][1:]
+            else:
+                move = json.loads((await request(f"ROLL {table} {to_move}"))[3:])
+            totals["moves"] += 1
+            if move["leg"] != leg:
+                # the tents were refilled for the new leg
+                tents = json.loads((await request(f"STATE {table}"))[3:])["ticket_tents"]
+            leg, to_move, finished = move["leg"], move["to_move"], move["finished"]
+        await request(f"CLOSE {table}")
+        totals["games"] += 1
+    writer.close()
+    await writer.wait_closed()
+    return totals
+
+
+async def run_load(connect, clients:int, games:int, advice_every:int=5, seed:int=None)->dict:
+    '''Plays games games spread over clients concurrent simulated clients
+
+        Return
+           dict - totals, throughput and client side latency percentiles
+    '''
+    rng = random.Random(seed)
+    latencies = []
+    start = time.perf_counter()
+    shares = [games//clients + (i < games % clients) for i in range(clients)]
+    results = await asyncio.gather(*[simulated_client(connect, share, advice_every, latencies,
+                                                      random.Random(rng.random())) for share in shares])
+    elapsed = time.perf_counter() - start
+    totals = {key:sum(result[key] for result in results) for key in results[0]}
+    latencies.sort()
+    percentile = lambda fraction: latencies[min(len(latencies)-1, int(fraction*len(latencies)))] if latencies else 0.0
+    totals.update({"elapsed_s":elapsed, "requests":len(latencies), "requests_per_s":len(latencies)/elapsed,
+                   "p50_s":percentile(0.5), "p90_s":percentile(0.9), "p99_s":percentile(0.99)})
+    return totals
+
+
+async def _main(args):
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    if args.command == "serve":
+        server = CamelUpServer(executor, max_pending=args.max_pending)
+        await server.serve(args.host, args.port, args.unix)
+        return
+
+    if args.unix:
+        connect = lambda: asyncio.open_unix_connection(args.unix)
+    else:
+        connect = lambda: asyncio.open_connection(args.host, args.port)
+    listener = None
+    if args.spawn:
+        # host the tables in this process, for a self-contained load test
+        server = CamelUpServer(executor, max_pending=args.max_pending)
+        listener = await server.listen(args.host, args.port, args.unix)
+    print(json.dumps(await run_load(connect, args.clients, args.games, args.advice_every, args.seed), indent=2))
+    if listener:
+        print(await server.do_metrics())
+        # every client has closed its connection: let the handlers read the end of their streams
+        listener.close()
+        if server.connections:
+            await asyncio.wait(server.connections)
+        await listener.wait_closed()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hosts Camel Up tables, or drives load against a server")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="use a Unix socket at this path instead of TCP")
+    parser.add_argument("--workers", type=int, help="analysis worker processes; the default is one per CPU")
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--advice-every", type=int, default=5, help="moves between ADVICE requests, 0 for none")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--spawn", action="store_true", help="load: also run the server in this process")
+    args = parser.parse_args()
+    asyncio.run(_main(args))
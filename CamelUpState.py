@@ -0,0 +1,103 @@
+'''Compact, integer-encoded Camel Up track state.
+
+   A track state is an immutable tuple with one int per camel, in the order of the board's
+   camel colors. Each int packs the camel's track position and its height in the stack
+   it belongs to:
+
+        code = position * HEIGHT_SLOTS + height
+
+   Height 0 is the bottom of a stack. Because the state is a tuple of ints it is hashable,
+   copying it is free, and looking up a camel is a single index.
+'''
+
+HEIGHT_SLOTS = 16 #supports up to 16 camels stacked in one space
+
+
+def encode_track(track:list[list[str]], camel_colors:list[str])->tuple[int, ...]:
+    '''Converts a 2D list model of the race track into a compact state
+
+        Args
+           track (list[list[str]]) - a 2D list model of the Camel Up race track
+           camel_colors (list[str]) - the camel colors, in the order used by the state
+
+        Return
+           tuple[int, ...] - the compact state: one packed (position, height) code per camel
+    '''
+    codes = {}
+    for position, stack in enumerate(track):
+        for height, camel in enumerate(stack):
+            codes[camel] = position * HEIGHT_SLOTS + height
+    return tuple(codes[color] for color in camel_colors)
+
+
+def decode_state(state:tuple[int, ...], camel_colors:list[str], track_positions:int)->list[list[str]]:
+    '''Converts a compact state back into a 2D list model of the race track
+
+        Args
+           state (tuple[int, ...]) - the compact state
+           camel_colors (list[str]) - the camel colors, in the order used by the state
+           track_positions (int) - the number of spaces on the track
+
+        Return
+           list[list[str]] - a 2D list model of the Camel Up race track
+    '''
+    track = [[] for i in range(track_positions)]
+    for code, color in sorted(zip(state, camel_colors)):
+        track[code // HEIGHT_SLOTS].append(color)
+    return track
+
+
+def position_of(state:tuple[int, ...], camel:int)->int:
+    '''Returns the track position of the camel at index camel'''
+    return state[camel] // HEIGHT_SLOTS
+
+
+def move(state:tuple[int, ...], camel:int, value:int, last:int)->tuple[int, ...]:
+    '''Moves a camel, along with every camel riding on top of it, value spaces forward.
+       The moving stack is placed on top of any camels already in the target space.
+       Camels never move past the last space of the track.
+
+        Args
+           state (tuple[int, ...]) - the compact state
+           camel (int) - the index of the camel to move
+           value (int) - the number of spaces to move
+           last (int) - the index of the last space on the track (the finish line)
+
+        Return
+           tuple[int, ...] - the new compact state
+    '''
+    code = state[camel]
+    position = code // HEIGHT_SLOTS
+    target = position + value
+    if target > last:
+        target = last
+    if target == position:
+        return state
+    # camels above the mover share its position and have a larger code
+    top = code - code % HEIGHT_SLOTS + HEIGHT_SLOTS
+    base = target * HEIGHT_SLOTS
+    shift = base - code
+    for other in state:
+        if base <= other < base + HEIGHT_SLOTS:
+            shift += 1
+    return tuple(other + shift if code <= other < top else other for other in state)
+
+
+def finishing_order(state:tuple[int, ...])->list[int]:
+    '''Returns the camel indices ordered from 1st place to last place'''
+    return sorted(range(len(state)), key=state.__getitem__, reverse=True)
+
+
+def rankings(state:tuple[int, ...])->tuple[int, int]:
+    '''Returns the indices of the 1st and 2nd place camels.
+       The leading camel has the largest code: furthest along the track and highest in its stack.
+    '''
+    first = second = -1
+    first_code = second_code = -1
+    for camel, code in enumerate(state):
+        if code > first_code:
+            second, second_code = first, first_code
+            first, first_code = camel, code
+        elif code > second_code:
+            second, second_code = camel, code
+    return (first, second)
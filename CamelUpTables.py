@@ -0,0 +1,224 @@
+'''Precomputed exact leg outcomes for a full pyramid.
+
+   With every die still in the pyramid, the outcome of a leg only depends on the shape of the camel
+   formation: the gaps between consecutive camels, ordered from the last camel to the leader (a gap of
+   0 means stacked on top). Neither absolute positions nor colors matter, as long as no camel can reach
+   the finish line during the leg. The table stores, for every shape with a span of at most MAX_SPAN:
+
+        - the furthest any camel can get from the last camel's starting space during the leg (reach)
+        - the counts of every finishing place for each place in the formation, and of every (1st, 2nd)
+          pair of formation places, over every dice sequence
+
+   Build the table offline once, then lookups are a few index computations into a memory-mapped file:
+
+        python CamelUpTables.py --workers 8
+'''
+import itertools
+import math
+import mmap
+import os
+import struct
+import sys
+import warnings
+from array import array
+
+import CamelUpState
+import CamelUpAnalysis
+
+MAGIC = b"CUPT"
+VERSION = 2 #version 1 tables only held 1st/2nd place counts
+MAX_SPAN = 15 #the longest formation that fits on a 16 space track
+TABLE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_tables = {} #loaded tables by (camels, dice_values)
+
+
+def table_path(camels:int, dice_values:tuple[int, ...])->str:
+    '''Returns the default location of the table for a number of camels and die faces'''
+    faces = "-".join(str(value) for value in dice_values) #(1, 2, 3) and (12, 3) must not share a file
+    return os.path.join(TABLE_DIRECTORY, f"camelup_leg_table_{camels}_{faces}.bin")
+
+
+def shape_state(gaps:tuple[int, ...])->tuple[int, ...]:
+    '''Returns the compact state of a formation, with the last camel on space 0.
+       Camel i of the state is the camel in place i of the formation, counting from the back.
+    '''
+    codes = [0]
+    for gap in gaps:
+        code = codes[-1]
+        codes.append(code+1 if gap == 0 else (code//CamelUpState.HEIGHT_SLOTS + gap)*CamelUpState.HEIGHT_SLOTS)
+    return tuple(codes)
+
+
+def shape_index(gaps:tuple[int, ...])->int:
+    '''Index of a formation's record: its rank in lexicographic order among all formations
+       with as many gaps and a span of at most MAX_SPAN
+    '''
+    index = 0
+    span = MAX_SPAN
+    for place, gap in enumerate(gaps):
+        rest = len(gaps) - place - 1
+        # formations sharing the earlier gaps with a smaller gap here: C(span+rest+1, rest+1) - C(span-gap+rest+1, rest+1)
+        index += math.comb(span+rest+1, rest+1) - math.comb(span-gap+rest+1, rest+1)
+        span -= gap
+    return index
+
+
+def shapes(camels:int)->list[tuple[int, ...]]:
+    '''Returns every formation of camels camels with a span of at most MAX_SPAN, in index order'''
+    return [gaps for gaps in itertools.product(range(MAX_SPAN+1), repeat=camels-1) if sum(gaps) <= MAX_SPAN]
+
+
+def max_reach(state:tuple[int, ...], mask:int, last:int, dice_values:tuple[int, ...], memo:dict)->int:
+    '''Returns the furthest space any camel can reach by the end of the leg'''
+    key = (state, mask)
+    reach = memo.get(key)
+    if reach is None:
+        reach = max(state) // CamelUpState.HEIGHT_SLOTS
+        for camel in CamelUpAnalysis.dice_in(mask):
+            for value in dice_values:
+                child = CamelUpState.move(state, camel, value, last)
+                reach = max(reach, max_reach(child, mask & ~(1 << camel), last, dice_values, memo))
+        memo[key] = reach
+    return reach
+
+
+def _solve_shape(task:tuple)->tuple[int, ...]:
+    '''Solves one formation on an open-ended track: returns its reach followed by its counts'''
+    gaps, dice_values = task
+    n = len(gaps)+1
+    state = shape_state(gaps)
+    # far enough that no camel is ever stopped by the finish line
+    last = MAX_SPAN + n*max(dice_values) + 1
+    mask = (1 << n) - 1
+    reach = max_reach(state, mask, last, dice_values, {})
+    return (reach,) + CamelUpAnalysis.count_leg_outcomes(state, mask, last, dice_values)
+
+
+def build_table(camels:int=5, dice_values:tuple[int, ...]=(1, 2, 3), path:str=None, workers:int=None):
+    '''Solves every formation with a span of at most MAX_SPAN and writes the table file
+
+        Args
+           camels (int) - the number of camels
+           dice_values (tuple[int, ...]) - the faces of each die
+           path (str) - where to write the table; defaults to table_path(camels, dice_values)
+           workers (int) - solve the formations on this many worker processes
+    '''
+    if not dice_values or not all(1 <= value <= 255 for value in dice_values):
+        raise ValueError("the table header stores each die face in one byte: faces must be from 1 to 255")
+    path = path or table_path(camels, dice_values)
+    tasks = [(gaps, tuple(dice_values)) for gaps in shapes(camels)]
+    if workers and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_solve_shape, tasks, chunksize=16))
+    else:
+        results = [_solve_shape(task) for task in tasks]
+
+    records = array("I")
+    for result in results:
+        records.extend(result)
+    if sys.byteorder == "big":
+        records.byteswap() #the file is little-endian
+    header = struct.pack("<4sHHH", MAGIC, VERSION, camels, len(dice_values)) + bytes(dice_values)
+    header += bytes(-len(header) % 8)
+    with open(path, "wb") as file:
+        file.write(header)
+        records.tofile(file)
+
+
+class LegTable:
+    '''A memory-mapped leg outcome table (see build_table)'''
+    def __init__(self, path:str, camels:int=None, dice_values:tuple[int, ...]=None):
+        '''
+            Args
+               path (str) - the table file
+               camels (int) - when given, the number of camels the table must have been built for
+               dice_values (tuple[int, ...]) - when given, the die faces the table must have been built for
+        '''
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.camels, faces = struct.unpack_from("<4sHHH", self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} Camel Up leg table")
+        self.dice_values = tuple(self._map[10:10+faces])
+        if camels is not None and self.camels != camels:
+            raise ValueError(f"{path} was built for {self.camels} camels, not {camels}")
+        if dice_values is not None and self.dice_values != tuple(dice_values):
+            raise ValueError(f"{path} was built for die faces {self.dice_values}, not {tuple(dice_values)}")
+        offset = 10 + faces
+        offset += -offset % 8
+        self.width = 1 + 2*self.camels*self.camels
+        if sys.byteorder == "big":
+            records = array("I", self._map[offset:])
+            records.byteswap()
+            self.records = memoryview(records)
+        else:
+            self.records = memoryview(self._map)[offset:].cast("I")
+
+    def lookup(self, state:tuple[int, ...], last:int)->tuple[int, ...]:
+        '''Returns the full pyramid counts of a state, laid out like CamelUpAnalysis.count_leg_outcomes,
+           or None when the table can not answer:
+           the formation is longer than MAX_SPAN or a camel could reach the finish line this leg
+        '''
+        n = self.camels
+        order = sorted(range(n), key=state.__getitem__)
+        positions = [state[camel] // CamelUpState.HEIGHT_SLOTS for camel in order]
+        if positions[-1] - positions[0] > MAX_SPAN:
+            return None
+        start = shape_index([positions[place] - positions[place-1] for place in range(1, n)])*self.width
+        if positions[0] + self.records[start] > last:
+            return None
+        records = self.records[start+1:start+self.width]
+        counts = [0]*(2*n*n)
+        for place, camel in enumerate(order):
+            # formation place i is camel order[i]
+            for rank in range(n):
+                counts[rank*n + camel] = records[rank*n + place]
+            for second, other in enumerate(order):
+                counts[n*n + camel*n + other] = records[n*n + place*n + second]
+        return tuple(counts)
+
+
+def load_table(camels:int, dice_values:tuple[int, ...])->LegTable:
+    '''Returns the table for a number of camels and die faces, loading it on first use,
+       or None when it has not been built
+    '''
+    key = (camels, tuple(dice_values))
+    if key not in _tables:
+        path = table_path(camels, dice_values)
+        _tables[key] = None
+        if os.path.exists(path):
+            try:
+                _tables[key] = LegTable(path, camels, dice_values)
+            except ValueError as error:
+                warnings.warn(f"{error}; rebuild it with: python CamelUpTables.py")
+    return _tables[key]
+
+
+def lookup_leg_outcomes(state:tuple[int, ...], mask:int, last:int, dice_values:tuple[int, ...])->tuple[int, ...]:
+    '''Answers count_leg_outcomes from the precomputed table when possible
+
+        Return
+           tuple[int, ...] - the same counts as count_leg_outcomes, or None when the pyramid is not full,
+                             no table was built or the table does not cover the state
+    '''
+    if mask != (1 << len(state)) - 1:
+        return None
+    table = load_table(len(state), dice_values)
+    if table is None:
+        return None
+    return table.lookup(state, last)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precomputes the full pyramid leg outcome table")
+    parser.add_argument("--camels", type=int, default=5)
+    parser.add_argument("--dice-values", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--output")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    build_table(args.camels, tuple(args.dice_values), args.output, args.workers)
+    print("wrote", args.output or table_path(args.camels, tuple(args.dice_values)), file=sys.stderr)